@@ -0,0 +1,267 @@
+"""
+Change detection between two index rasters of the same tile (written by
+index_def.py --raster). The scenes are compared block by block on the grid
+of the earlier one: when the later scene is on a different grid it is
+reprojected window by window through a WarpedVRT, so neither scene is ever
+held in memory whole. Blocks are processed in parallel and produce a delta
+raster, a gain/loss mask for differences beyond the threshold and summary
+statistics for the publication.
+"""
+import argparse
+import glob
+import json
+import logging
+import pathlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+
+# Turn on logging
+logging.getLogger().setLevel(logging.INFO)
+logging.info("change_detection module loaded")
+logging.info(f"Current working directory: {pathlib.Path.cwd()}")
+
+# Change mask classes
+NO_CHANGE = 0
+GAIN = 1
+LOSS = 2
+MASK_NODATA = 255
+# Histogram of the index difference (normalized-difference indices span [-2, 2])
+HISTOGRAM_BINS = np.linspace(-2.0, 2.0, 41)
+
+# Define CLI hooks
+def main():
+    parser = argparse.ArgumentParser(description="Difference two index rasters and summarise what changed")
+    parser.add_argument('-a',
+                        '--after',
+                        type=pathlib.Path,
+                        required=True,
+                        help="Index raster of the later scene (a quoted glob pattern must match exactly one file)")
+    parser.add_argument('-b',
+                        '--before',
+                        type=pathlib.Path,
+                        help="Index raster of the earlier scene")
+    parser.add_argument('--history',
+                        type=pathlib.Path,
+                        help="Directory of earlier index rasters; the latest earlier acquisition of the same tile is used as --before, and --after is added to it")
+    parser.add_argument('-t',
+                        '--threshold',
+                        type=float,
+                        default=0.1,
+                        help="Absolute index difference counted as change")
+    parser.add_argument('-o',
+                        '--output_dir',
+                        type=pathlib.Path,
+                        default=pathlib.Path('.'),
+                        help="Directory for change_delta.tif, change_mask.tif and change_summary.json")
+    parser.add_argument('--block_size',
+                        type=int,
+                        default=1024)
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None)
+
+    args = parser.parse_args()
+
+    args.after = resolve_single(args.after)
+    before = args.before
+    if before is None and args.history:
+        before = previous_from_history(args.history, args.after)
+    if before is None:
+        logging.info("No earlier scene to compare against; skipping change detection")
+    else:
+        detect_changes(before, args.after, args.output_dir, args.threshold, args.block_size, args.workers)
+    if args.history:
+        add_to_history(args.history, args.after)
+
+
+def resolve_single(path):
+    # pipeline.py passes the pattern unexpanded; the shell would pass it through
+    # literally on no match and as extra arguments on several
+    if not glob.has_magic(str(path)):
+        return path
+    matches = sorted(glob.glob(str(path)))
+    if len(matches) != 1:
+        raise Exception(f"Expected exactly one index raster matching {path}, found {len(matches)}: {matches}")
+    return pathlib.Path(matches[0])
+
+
+## Scene history
+# Index rasters are named <tile>_<acquisition time>_<index>_<resolution>.index.tif
+def scene_key(path):
+    parts = path.name.split('.')[0].split('_')
+    return '_'.join([parts[0]] + parts[2:]), parts[1]
+
+def previous_from_history(history, after):
+    series, acquired = scene_key(after)
+    earlier = sorted(p for p in (history / series).glob('*.index.tif') if p.name.split('.')[0] < acquired)
+    if not earlier:
+        return None
+    logging.info(f"Comparing against {earlier[-1]}")
+    return earlier[-1]
+
+def add_to_history(history, after):
+    series, acquired = scene_key(after)
+    target = history / series / f"{acquired}.index.tif"
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(after, target)
+        logging.info(f"Added {after} to {target.parent}")
+
+
+## Differencing
+class BlockReader:
+    # rasterio datasets are not thread-safe, so every worker thread opens its own
+    # handles; the later scene is warped onto the earlier scene's grid when needed
+    def __init__(self, before_path, after_path):
+        self.before_path = before_path
+        self.after_path = after_path
+        self.local = threading.local()
+        self.handles = []
+        self.lock = threading.Lock()
+
+    def datasets(self):
+        if not hasattr(self.local, "before"):
+            before = rasterio.open(self.before_path)
+            after = rasterio.open(self.after_path)
+            handles = [before, after]
+            if not same_grid(before, after):
+                after = WarpedVRT(after, crs=before.crs, transform=before.transform,
+                                  width=before.width, height=before.height,
+                                  resampling=Resampling.bilinear, nodata=after.nodata)
+                handles.append(after)
+            self.local.before, self.local.after = before, after
+            with self.lock:
+                self.handles.extend(handles)
+        return self.local.before, self.local.after
+
+    def close(self):
+        for handle in reversed(self.handles):
+            handle.close()
+
+def same_grid(a, b):
+    return a.crs == b.crs and a.transform == b.transform and a.width == b.width and a.height == b.height
+
+def read_index(dataset, scale, offset, window):
+    # Decoded float32 block with nodata as NaN (int16 rasters carry scale/offset)
+    block = dataset.read(1, window=window, masked=True)
+    values = block.filled(0).astype('f4') * np.float32(scale) + np.float32(offset)
+    values[np.ma.getmaskarray(block)] = np.nan
+    return values
+
+def scale_offset(path):
+    with rasterio.open(path) as src:
+        return src.scales[0], src.offsets[0]
+
+def block_windows(width, height, block_size):
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            yield Window(col, row, min(block_size, width - col), min(block_size, height - row))
+
+def block_statistics(delta, mask):
+    valid = np.isfinite(delta)
+    values = delta[valid].astype('f8')
+    return {
+        "valid": int(values.size),
+        "sum": float(values.sum()),
+        "sum_squares": float((values * values).sum()),
+        "min": float(values.min()) if values.size else None,
+        "max": float(values.max()) if values.size else None,
+        "gain": int((mask == GAIN).sum()),
+        "loss": int((mask == LOSS).sum()),
+        "histogram": np.histogram(np.clip(values, HISTOGRAM_BINS[0], HISTOGRAM_BINS[-1]), bins=HISTOGRAM_BINS)[0],
+    }
+
+def detect_changes(before_path, after_path, output_dir, threshold, block_size=1024, workers=None):
+    logging.info('-'*80)
+    logging.info(f"Detecting changes from {before_path} to {after_path}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    before_scale = scale_offset(before_path)
+    after_scale = scale_offset(after_path)
+
+    with rasterio.open(before_path) as before, rasterio.open(after_path) as after:
+        reprojected = not same_grid(before, after)
+        grid = {"crs": before.crs, "transform": before.transform, "width": before.width, "height": before.height}
+    if reprojected:
+        logging.info("Scenes are on different grids; reprojecting the later scene window by window")
+
+    tiling = {"driver": "GTiff", "count": 1, "tiled": True, "blockxsize": 512, "blockysize": 512, "compress": "deflate"}
+    delta_path = output_dir / "change_delta.tif"
+    mask_path = output_dir / "change_mask.tif"
+    reader = BlockReader(before_path, after_path)
+    write_lock = threading.Lock()
+
+    with rasterio.open(delta_path, 'w', dtype='float32', nodata=np.nan, predictor=3, **grid, **tiling) as delta_dst, \
+         rasterio.open(mask_path, 'w', dtype='uint8', nodata=MASK_NODATA, **grid, **tiling) as mask_dst:
+
+        def process(window):
+            before_ds, after_ds = reader.datasets()
+            delta = read_index(after_ds, *after_scale, window) - read_index(before_ds, *before_scale, window)
+            mask = np.full(delta.shape, NO_CHANGE, dtype='uint8')
+            mask[delta >= threshold] = GAIN
+            mask[delta <= -threshold] = LOSS
+            mask[~np.isfinite(delta)] = MASK_NODATA
+            with write_lock:
+                delta_dst.write(delta, 1, window=window)
+                mask_dst.write(mask, 1, window=window)
+            return block_statistics(delta, mask)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                blocks = list(executor.map(process, block_windows(grid["width"], grid["height"], block_size)))
+        finally:
+            reader.close()
+
+    summary = summarize(blocks, grid, threshold)
+    summary.update({
+        "before": str(before_path),
+        "after": str(after_path),
+        "reprojected": reprojected,
+        "delta_raster": delta_path.name,
+        "mask_raster": mask_path.name,
+    })
+    summary_path = output_dir / "change_summary.json"
+    with open(summary_path, 'w') as dst:
+        json.dump(summary, dst, indent=2)
+    logging.info(f"Change summary written to {summary_path}")
+    return summary
+
+def summarize(blocks, grid, threshold):
+    valid = sum(b["valid"] for b in blocks)
+    gain = sum(b["gain"] for b in blocks)
+    loss = sum(b["loss"] for b in blocks)
+    mean = sum(b["sum"] for b in blocks) / valid if valid else None
+    variance = sum(b["sum_squares"] for b in blocks) / valid - mean * mean if valid else None
+    minima = [b["min"] for b in blocks if b["min"] is not None]
+    maxima = [b["max"] for b in blocks if b["max"] is not None]
+    # Pixel area in km² (the grids are projected, in metres)
+    pixel_km2 = abs(grid["transform"].a * grid["transform"].e) / 1e6
+    return {
+        "threshold": threshold,
+        "pixels": grid["width"] * grid["height"],
+        "valid_pixels": valid,
+        "mean_delta": mean,
+        "std_delta": float(np.sqrt(max(variance, 0.0))) if valid else None,
+        "min_delta": min(minima) if minima else None,
+        "max_delta": max(maxima) if maxima else None,
+        "gain_pixels": gain,
+        "loss_pixels": loss,
+        "gain_fraction": gain / valid if valid else None,
+        "loss_fraction": loss / valid if valid else None,
+        "gain_km2": gain * pixel_km2,
+        "loss_km2": loss * pixel_km2,
+        "histogram": {
+            "bin_edges": [round(float(edge), 2) for edge in HISTOGRAM_BINS],
+            "counts": [int(count) for count in sum(b["histogram"] for b in blocks)],
+        },
+    }
+
+
+if __name__ == "__main__":
+    main()
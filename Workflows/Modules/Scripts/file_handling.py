@@ -3,26 +3,219 @@ import numpy as np
 import pickle
 import logging
 import pathlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import time
+import tracemalloc
 logging.getLogger().setLevel(logging.INFO)
 
 logging.info("File handling module loaded")
 logging.info(f"Current working directory: {pathlib.Path.cwd()}")
 
-def write_band_to_file(band_name, band_array, band_link):    
+# Opt-in instrumentation shared by index_def.py and tiff_gen.py (--profile / --cprofile)
+class Phase:
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.bytes = 0
+        self.pixels = 0
+
+    def add(self, nbytes=0, pixels=0):
+        self.bytes += int(nbytes)
+        self.pixels += int(pixels)
+
+    def summary(self):
+        return {
+            "seconds": round(self.seconds, 6),
+            "calls": self.calls,
+            "bytes": self.bytes,
+            "pixels": self.pixels,
+            "megabytes_per_second": round(self.bytes / self.seconds / 1e6, 3) if self.seconds and self.bytes else None,
+            "megapixels_per_second": round(self.pixels / self.seconds / 1e6, 3) if self.seconds and self.pixels else None,
+        }
+
+
+class PhaseTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.phase = profiler.phases.setdefault(name, Phase()) if profiler.enabled else Phase()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.phase
+
+    def __exit__(self, *exc):
+        if self.profiler.enabled:
+            self.phase.seconds += time.perf_counter() - self.started
+            self.phase.calls += 1
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}
+        self.info = {}
+        self.cprofile = None
+
+    def start(self, script, use_cprofile=False):
+        self.enabled = True
+        self.script = script
+        self.started = time.perf_counter()
+        tracemalloc.start()
+        if use_cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def phase(self, name):
+        return PhaseTimer(self, name)
+
+    def record(self, key, value):
+        # Extra facts about the run, written alongside the phases
+        self.info[key] = value
+
+    def write(self, path=None, top=25):
+        if not self.enabled:
+            return None
+        path = path or f"{self.script}_profile.json"
+        _, traced_peak = tracemalloc.get_traced_memory()
+        profile = {
+            "script": self.script,
+            "wall_seconds": round(time.perf_counter() - self.started, 6),
+            "cpu_seconds": round(time.process_time(), 6),
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "peak_traced_bytes": traced_peak,
+            "phases": {name: phase.summary() for name, phase in self.phases.items()},
+            **self.info,
+        }
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            stream = io.StringIO()
+            pstats.Stats(self.cprofile, stream=stream).sort_stats("cumulative").print_stats(top)
+            profile["cprofile_top"] = stream.getvalue().splitlines()
+        with open(path, "w") as dst:
+            json.dump(profile, dst, indent=2)
+        logging.info(f"Profile written to {path}")
+        return path
+
+
+profiler = Profiler()
+
+# Storage encodings for index matrices. float32 keeps the computed values;
+# float16 and int16 halve the size with bounded precision loss. int16 maps
+# [-1, 1] (normalized-difference indices) onto +-32767 with a fixed scale
+# (quantization error scale/2 = 1/65534, about 1.53e-5 once decoded to
+# float32) and other ranges with a scale/offset derived from the data;
+# -32768 marks NaN.
+INDEX_ENCODINGS = ["float32", "float16", "int16"]
+INT16_NODATA = -32768
+INT16_MAX = 32767
+
+def encode_index(index_array, encoding):
+    if encoding == "float32":
+        return index_array.astype('f4', copy=False), {"encoding": "float32"}
+    if encoding == "float16":
+        # float16 keeps 11 significant bits
+        return index_array.astype('f2'), {"encoding": "float16", "max_relative_error": 2.0 ** -11}
+    if encoding != "int16":
+        raise Exception(f"Unknown index encoding {encoding}; expected one of {INDEX_ENCODINGS}")
+    finite = np.isfinite(index_array)
+    low = float(index_array[finite].min()) if finite.any() else 0.0
+    high = float(index_array[finite].max()) if finite.any() else 0.0
+    if -1.0 <= low and high <= 1.0:
+        scale, offset = 1.0 / INT16_MAX, 0.0
+    else:
+        scale, offset = max(high - low, 1e-12) / (2 * INT16_MAX), (high + low) / 2
+    encoded = np.full(index_array.shape, INT16_NODATA, dtype='i2')
+    encoded[finite] = np.rint((index_array[finite] - offset) / scale)
+    header = {
+        "encoding": "int16",
+        "scale": scale,
+        "offset": offset,
+        "nodata": INT16_NODATA,
+        "max_abs_error": scale / 2,
+    }
+    return encoded, header
+
+def decode_index(encoded, header):
+    if header["encoding"] == "int16":
+        decoded = encoded.astype('f4') * np.float32(header["scale"]) + np.float32(header["offset"])
+        decoded[encoded == header["nodata"]] = np.nan
+        return decoded
+    return encoded.astype('f4', copy=False)
+
+def write_band_to_file(band_name, band_array, band_link, directory='.'):
     # extract the band profile
     profile = rasterio.open(band_link).profile
     # Write the profile and array to disk
-    with open(band_name + '.pickle', 'wb') as dst:
-        pickle.dump([band_name, band_array, profile], dst, protocol=pickle.HIGHEST_PROTOCOL)
+    with profiler.phase("serialize") as phase:
+        with open(os.path.join(directory, band_name + '.pickle'), 'wb') as dst:
+            pickle.dump([band_name, band_array, profile], dst, protocol=pickle.HIGHEST_PROTOCOL)
+        phase.add(nbytes=band_array.nbytes, pixels=band_array.size)
+
+def write_index_to_file(index_name, index_array, profile, encoding="float32", raster=False):
+    # Write index name, array, profile and the encoding header to disk
+    logging.info(f'Writing index {index_name} to file ({encoding})')
+    with profiler.phase("encode_index") as phase:
+        encoded, header = encode_index(index_array, encoding)
+        phase.add(nbytes=index_array.nbytes, pixels=index_array.size)
+    profiler.record("index_encoding", header)
+    with profiler.phase("serialize") as phase:
+        with open(index_name + '.pickle', 'wb') as dst:
+            pickle.dump([index_name, encoded, profile, header], dst, protocol=pickle.HIGHEST_PROTOCOL)
+        phase.add(nbytes=encoded.nbytes, pixels=encoded.size)
+    if raster:
+        write_index_raster(index_name, encoded, header, profile)
 
-def write_index_to_file(index_name, index_array, profile):
-    # Write index name, array and profile to disk
-    logging.info(f'Writing index {index_name} to file')
-    with open(index_name + '.pickle', 'wb') as dst:
-        pickle.dump([index_name, index_array, profile], dst, protocol=pickle.HIGHEST_PROTOCOL)
+# Georeferenced, tiled copy of the index (<index_name>.index.tif) that can be
+# read window by window, e.g. by change_detection.py. int16 keeps its
+# encoding through the GDAL scale/offset and nodata; float16 is widened to
+# float32, which GeoTIFF readers support everywhere.
+def write_index_raster(index_name, encoded, header, profile):
+    path = index_name + '.index.tif'
+    logging.info(f'Writing index raster {path}')
+    int16 = header["encoding"] == "int16"
+    raster_profile = {
+        "driver": "GTiff",
+        "width": encoded.shape[-1],
+        "height": encoded.shape[-2],
+        "count": 1,
+        "dtype": "int16" if int16 else "float32",
+        "crs": profile.get("crs"),
+        "transform": profile.get("transform"),
+        "nodata": header["nodata"] if int16 else np.nan,
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "deflate",
+        "predictor": 2 if int16 else 3,
+    }
+    with profiler.phase("write_raster") as phase:
+        with rasterio.open(path, 'w', **raster_profile) as dst:
+            dst.write(encoded.reshape(1, encoded.shape[-2], encoded.shape[-1]).astype(raster_profile["dtype"], copy=False))
+            if int16:
+                dst.scales = (header["scale"],)
+                dst.offsets = (header["offset"],)
+            dst.update_tags(index_encoding=json.dumps(header))
+        phase.add(nbytes=os.path.getsize(path), pixels=encoded.size)
+    return path
 
 def read_band_from_file(band):
-    # Read the pickle file
-    with open(band, 'rb') as inp:
-        band_info = pickle.load(inp)
-    return band_info
\ No newline at end of file
+    # Read the pickle file; encoded index matrices come back as float32
+    with profiler.phase("deserialize") as phase:
+        with open(band, 'rb') as inp:
+            band_info = pickle.load(inp)
+        phase.add(nbytes=os.path.getsize(band), pixels=band_info[1].size)
+    if len(band_info) > 3:
+        with profiler.phase("decode_index") as phase:
+            name, encoded, profile, header = band_info
+            band_info = [name, decode_index(encoded, header), profile]
+            phase.add(nbytes=band_info[1].nbytes, pixels=band_info[1].size)
+        profiler.record("index_encoding", header)
+    return band_info
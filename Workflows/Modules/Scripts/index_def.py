@@ -41,9 +41,35 @@ def main():
     parser.add_argument('-f',
                         '--force_recompute',
                         action='store_true')
+    parser.add_argument('--band_cache',
+                        type=pathlib.Path,
+                        default=pathlib.Path('.'),
+                        help="Directory for the intermediate band pickles (default: the working directory)")
+    parser.add_argument('--encoding',
+                        choices=INDEX_ENCODINGS,
+                        default="float32",
+                        help="Storage encoding of the index matrix (float16/int16 halve its size with bounded precision loss)")
+    parser.add_argument('--raster',
+                        action='store_true',
+                        help="Also write the index as a georeferenced, tiled GeoTIFF (<name>.index.tif)")
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="Write per-phase timings, throughput and peak memory to index_def_profile.json")
+    parser.add_argument('--cprofile',
+                        action='store_true',
+                        help="Also run under cProfile and include the top functions in the profile (implies --profile)")
 
     args = parser.parse_args()
 
+    if args.profile or args.cprofile:
+        profiler.start("index_def", use_cprofile=args.cprofile)
+
+    global band_cache, index_encoding, index_raster
+    band_cache = args.band_cache
+    band_cache.mkdir(parents=True, exist_ok=True)
+    index_encoding = args.encoding
+    index_raster = args.raster
+
     if args.index in index:
         if (args.force_recompute):
             logging.info('-'*80)
@@ -52,17 +78,31 @@ def main():
     else:
         print("Index not found")
 
+    profiler.write()
+
+# Band pickles are intermediates; --band_cache keeps them out of the step's outputs
+band_cache = pathlib.Path('.')
+# Storage encoding of the index pickle (--encoding)
+index_encoding = "float32"
+# Also write <name>.index.tif (--raster)
+index_raster = False
+
+def band_pickle(band):
+    return band_cache / band.with_suffix('.pickle').name
+
 # Helper function to check if band has been seen before & therefor does not need to be re-written to disk
 def bands_exist(bands, recompute):
     for band in bands:
-        if not (pathlib.Path((band.with_suffix('.pickle').name)).exists()) or recompute:
-            logging.info("{} does not exist. Generating ...".format(band.with_suffix('.pickle').name))
-            band_link = rasterio.open(str(band))
-            band_array = band_link.read()
-            band_link.close()
-            write_band_to_file(band.with_suffix('').name, band_array, band)
+        if not band_pickle(band).exists() or recompute:
+            logging.info("{} does not exist. Generating ...".format(band_pickle(band)))
+            with profiler.phase("band_open_decode") as phase:
+                band_link = rasterio.open(str(band))
+                band_array = band_link.read()
+                band_link.close()
+                phase.add(nbytes=band_array.nbytes, pixels=band_array.size)
+            write_band_to_file(band.with_suffix('').name, band_array, band, band_cache)
         else:
-            logging.info("{} exists! Skipping ingestion ...".format(band.with_suffix('.pickle').name))
+            logging.info("{} exists! Skipping ingestion ...".format(band_pickle(band)))
 
 def gen_output_name(band, index):
     index_out = band.with_suffix('').name.split("_")
@@ -98,12 +138,17 @@ def ndvi(bands, index, recompute):
         logging.info("Index matrix does not exist. Creating ...")
         # Open each bands datafile for index calculation.
         for band in bands:
-            band_data.append(read_band_from_file(band.with_suffix('.pickle').name))
+            band_data.append(read_band_from_file(str(band_pickle(band))))
         # Set as associated band for code readability
-        B04 = band_data[0][1].astype('f4')
-        B8A = band_data[1][1].astype('f4')
+        with profiler.phase("dtype_conversion") as phase:
+            B04 = band_data[0][1].astype('f4')
+            B8A = band_data[1][1].astype('f4')
+            phase.add(nbytes=B04.nbytes + B8A.nbytes, pixels=B04.size)
+        with profiler.phase("index_math") as phase:
+            index_array = (B8A - B04)/(B8A + B04)
+            phase.add(nbytes=index_array.nbytes, pixels=index_array.size)
         # Write index to disk
-        write_index_to_file(index_out, (B8A - B04)/(B8A + B04), band_data[0][2])
+        write_index_to_file(index_out, index_array, band_data[0][2], index_encoding, index_raster)
     else:
         logging.info("Index matrix exists! Skipping computation ...")
 
@@ -125,12 +170,17 @@ def reci(bands, index, recompute):
         logging.info("Index matrix does not exist. Creating ...")
         # Open each bands datafile for index calculation.
         for band in bands:
-            band_data.append(read_band_from_file(band.with_suffix('.pickle').name))
+            band_data.append(read_band_from_file(str(band_pickle(band))))
         # Set as associated band for code readability
-        B04 = band_data[0][1].astype('f4')
-        B8A = band_data[1][1].astype('f4')
+        with profiler.phase("dtype_conversion") as phase:
+            B04 = band_data[0][1].astype('f4')
+            B8A = band_data[1][1].astype('f4')
+            phase.add(nbytes=B04.nbytes + B8A.nbytes, pixels=B04.size)
+        with profiler.phase("index_math") as phase:
+            index_array = (B8A/B04) -1
+            phase.add(nbytes=index_array.nbytes, pixels=index_array.size)
         # Write index to disk
-        write_index_to_file(index_out,(B8A/B04) -1, band_data[0][2])
+        write_index_to_file(index_out, index_array, band_data[0][2], index_encoding, index_raster)
     else:
         logging.info("Index matrix exists! Skipping computation ...")
 
@@ -154,12 +204,17 @@ def ndre(bands, index, recompute):
         logging.info("Index matrix does not exist. Creating ...")
         # Open each bands datafile for index calculation.
         for band in bands:
-            band_data.append(read_band_from_file(band.with_suffix('.pickle').name))
+            band_data.append(read_band_from_file(str(band_pickle(band))))
         # Set as associated band for code readability
-        B05 = band_data[0][1].astype('f4')
-        B8A = band_data[1][1].astype('f4')
+        with profiler.phase("dtype_conversion") as phase:
+            B05 = band_data[0][1].astype('f4')
+            B8A = band_data[1][1].astype('f4')
+            phase.add(nbytes=B05.nbytes + B8A.nbytes, pixels=B05.size)
+        with profiler.phase("index_math") as phase:
+            index_array = (B8A - B05) / (B8A + B05)
+            phase.add(nbytes=index_array.nbytes, pixels=index_array.size)
         # Write index to disk
-        write_index_to_file(index_out,(B8A - B05) / (B8A + B05), band_data[0][2])
+        write_index_to_file(index_out, index_array, band_data[0][2], index_encoding, index_raster)
     else:
         logging.info("Index matrix exists! Skipping computation ...")
 
@@ -181,12 +236,17 @@ def gndvi(bands, index, recompute):
         logging.info("Index matrix does not exist. Creating ...")
         # Open each bands datafile for index calculation.
         for band in bands:
-            band_data.append(read_band_from_file(band.with_suffix('.pickle').name))
+            band_data.append(read_band_from_file(str(band_pickle(band))))
         # Set as associated band for code readability
-        B03 = band_data[0][1].astype('f4')
-        B8A = band_data[1][1].astype('f4')
+        with profiler.phase("dtype_conversion") as phase:
+            B03 = band_data[0][1].astype('f4')
+            B8A = band_data[1][1].astype('f4')
+            phase.add(nbytes=B03.nbytes + B8A.nbytes, pixels=B03.size)
+        with profiler.phase("index_math") as phase:
+            index_array = ((B8A - B03) / (B8A + B03))
+            phase.add(nbytes=index_array.nbytes, pixels=index_array.size)
         # Write index to disk
-        write_index_to_file(index_out,((B8A - B03) / (B8A + B03)), band_data[0][2])
+        write_index_to_file(index_out, index_array, band_data[0][2], index_encoding, index_raster)
     else:
         logging.info("Index matrix exists! Skipping computation ...")
     
@@ -2,7 +2,7 @@ import logging
 import argparse
 import pathlib
 import matplotlib.pyplot as plt
-from file_handling import read_band_from_file
+from file_handling import read_band_from_file, profiler
 
 # Turn logging on
 logging.getLogger().setLevel(logging.INFO)
@@ -25,14 +25,25 @@ def main():
                         '--force_recompute',
                         action='store_true',
                         help="Recomputes tiff regardless if it is found in directory")
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="Write per-phase timings, throughput and peak memory to tiff_gen_profile.json")
+    parser.add_argument('--cprofile',
+                        action='store_true',
+                        help="Also run under cProfile and include the top functions in the profile (implies --profile)")
 
     args = parser.parse_args()
 
+    if args.profile or args.cprofile:
+        profiler.start("tiff_gen", use_cprofile=args.cprofile)
+
     if (args.force_recompute):
         logging.info("Forced recomputation - recomputing ...")
 
     generate_tiff(args.index_file, args.color, args.force_recompute)
 
+    profiler.write()
+
 
 ## Image generation
 def generate_tiff(index, color, recompute):
@@ -46,16 +57,20 @@ def generate_tiff(index, color, recompute):
     # Check if tiff already exists for this index
     if not (outfile.exists()) or recompute:
         logging.info("Tiff image does not exist. Creating ...")
-        if (color != None):
-            plt.imshow(index_matrix, cmap=color)
-        else:
-            plt.imshow(index_matrix)
-        plt.colorbar()
-        plt.title(index_name)
-        plt.xlabel("Column #")
-        plt.ylabel("Row #")
+        with profiler.phase("colormap_render") as phase:
+            if (color != None):
+                plt.imshow(index_matrix, cmap=color)
+            else:
+                plt.imshow(index_matrix)
+            plt.colorbar()
+            plt.title(index_name)
+            plt.xlabel("Column #")
+            plt.ylabel("Row #")
+            phase.add(nbytes=index_matrix.nbytes, pixels=index_matrix.size)
         logging.info(f"Saving tiff image to {str(outfile)}")
-        plt.savefig(outfile, dpi=800)
+        with profiler.phase("encode") as phase:
+            plt.savefig(outfile, dpi=800)
+            phase.add(nbytes=outfile.stat().st_size, pixels=index_matrix.size)
     else:
         logging.info("{} exists! Skipping computation ...".format(str(outfile)))
 
@@ -0,0 +1,256 @@
+# bench.py
+#
+# Benchmarks for the workflow scripts and crate packaging on synthetic
+# Sentinel-2-sized rasters (see synthetic.py), so no credentials or network
+# access are needed. Every case runs in a fresh subprocess so peak memory
+# (ru_maxrss) is measured per case, and cases are timed with the profiler
+# off; --phases adds a per-phase breakdown from a second, profiled run that
+# is reported but never compared. Results are written as JSON and compared
+# against a stored baseline when one exists; a drop in throughput or growth
+# in peak memory beyond the threshold is reported as a regression (exit
+# status 1).
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench [--sizes 1830 5490] [--cases index_def tiff_gen] [--phases] [--save-baseline]
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = REPO_ROOT / "Workflows" / "Modules" / "Scripts"
+RESULTS_PATH = ".cache/benchmarks/results.json"
+BASELINE_PATH = "benchmarks/baseline.json"
+# Relative change that counts as a regression
+DEFAULT_THRESHOLD = 0.15
+
+CASES = ["index_def", "file_handling", "tiff_gen", "crate_zip"]
+# Index encodings exercised by the file_handling round-trip
+FILE_HANDLING_MODES = ["float32", "float16", "int16"]
+
+
+def zip_modes():
+    return {"serial": 1, "parallel": os.cpu_count() or 1}
+
+
+def import_scripts():
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    sys.path.insert(0, str(REPO_ROOT))
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def index_array(size):
+    from benchmarks.synthetic import band_rows
+    b03 = band_rows("B03", size, 0, size).astype("f4")
+    b08 = band_rows("B08", size, 0, size).astype("f4")
+    return ((b08 - b03) / (b08 + b03))[None]
+
+
+# --- Cases: each runs inside its own subprocess, times only the code under
+# test and returns (seconds, pixels, extra) ---
+
+def case_index_def(size, fmt, mode, workdir):
+    from benchmarks.synthetic import ensure_bands
+    bands = [Path(p) for p in ensure_bands(size, fmt)]
+    os.chdir(workdir)
+    import index_def
+    started = time.perf_counter()
+    index_def.gndvi(bands, "GNDVI", True)
+    return time.perf_counter() - started, size * size, {}
+
+
+def case_file_handling(size, fmt, mode, workdir):
+    array = index_array(size)
+    os.chdir(workdir)
+    from file_handling import read_band_from_file, write_index_to_file
+    started = time.perf_counter()
+    write_index_to_file("GNDVI", array, {"width": size, "height": size}, mode)
+    read_band_from_file("GNDVI.pickle")
+    return time.perf_counter() - started, size * size, {"file_bytes": os.path.getsize("GNDVI.pickle")}
+
+
+def case_tiff_gen(size, fmt, mode, workdir):
+    array = index_array(size)
+    os.chdir(workdir)
+    from file_handling import write_index_to_file
+    import tiff_gen
+    write_index_to_file("T34TEQ_20150729T092006_GNDVI_10m", array, {"width": size, "height": size})
+    started = time.perf_counter()
+    tiff_gen.generate_tiff(Path("T34TEQ_20150729T092006_GNDVI_10m.pickle"), "RdYlGn", True)
+    return time.perf_counter() - started, size * size, {}
+
+
+def case_crate_zip(size, fmt, mode, workdir):
+    from benchmarks.synthetic import ensure_bands
+    from crate_packaging import directory_entries, write_zip
+    crate_dir = os.path.join(workdir, "bench.crate")
+    os.makedirs(crate_dir)
+    total = 0
+    for path in ensure_bands(size, fmt):
+        shutil.copy(path, crate_dir)
+        total += os.path.getsize(path)
+    zip_path = os.path.join(workdir, "bench.crate.zip")
+    started = time.perf_counter()
+    write_zip(zip_path, directory_entries(crate_dir), workers=zip_modes()[mode])
+    seconds = time.perf_counter() - started
+    return seconds, 2 * size * size, {"input_bytes": total, "zip_bytes": os.path.getsize(zip_path)}
+
+
+CASE_FUNCTIONS = {
+    "index_def": case_index_def,
+    "file_handling": case_file_handling,
+    "tiff_gen": case_tiff_gen,
+    "crate_zip": case_crate_zip,
+}
+
+
+def run_case_in_process(spec, profiled=False):
+    import_scripts()
+    from file_handling import profiler
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        # tracemalloc slows allocation-heavy code severalfold, so only the
+        # separate --phases run turns the profiler on
+        if profiled:
+            profiler.start(spec["case"])
+        seconds, pixels, extra = CASE_FUNCTIONS[spec["case"]](spec["size"], spec["format"], spec["mode"], workdir)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if profiled:
+        return {"phases": {name: phase.summary() for name, phase in profiler.phases.items()}}
+    return dict(spec, **extra, **{
+        "seconds": round(seconds, 4),
+        "megapixels_per_second": round(pixels / seconds / 1e6, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+def run_subprocess(spec, profiled=False):
+    command = [sys.executable, "-m", "benchmarks.bench", "--run-case", json.dumps(spec)]
+    if profiled:
+        command.append("--phases")
+    output = subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_case(spec, phases=False):
+    # Fresh interpreter per case so peak RSS is not inherited from earlier cases
+    result = run_subprocess(spec)
+    if phases:
+        result.update(run_subprocess(spec, profiled=True))
+    return result
+
+
+def case_specs(cases, sizes, formats):
+    specs = []
+    for case in cases:
+        for size in sizes:
+            if case == "index_def":
+                specs += [{"case": case, "size": size, "format": fmt, "mode": "default"} for fmt in formats]
+            elif case == "crate_zip":
+                specs += [{"case": case, "size": size, "format": formats[0], "mode": mode} for mode in zip_modes()]
+            elif case == "file_handling":
+                specs += [{"case": case, "size": size, "format": "array", "mode": mode} for mode in FILE_HANDLING_MODES]
+            else:
+                specs.append({"case": case, "size": size, "format": "array", "mode": "default"})
+    return specs
+
+
+def result_key(result):
+    return f"{result['case']}/{result['size']}/{result['format']}/{result['mode']}"
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    previous = {result_key(r): r for r in baseline.get("results", [])}
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        if result["megapixels_per_second"] < old["megapixels_per_second"] * (1 - threshold):
+            regressions.append(f"{result_key(result)}: throughput {old['megapixels_per_second']} -> {result['megapixels_per_second']} Mpx/s")
+        if result["peak_rss_kb"] > old["peak_rss_kb"] * (1 + threshold):
+            regressions.append(f"{result_key(result)}: peak RSS {old['peak_rss_kb']} -> {result['peak_rss_kb']} kB")
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def main():
+    from benchmarks.synthetic import SIZES, available_formats, ensure_bands
+
+    parser = argparse.ArgumentParser(description="Benchmark the workflow scripts on synthetic Sentinel-2 rasters.")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--sizes", nargs="+", type=int, choices=SIZES, default=SIZES)
+    parser.add_argument("--formats", nargs="+", help="Band formats (default: every available one)")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--phases", action="store_true",
+                        help="Also run each case under the profiler for a per-phase breakdown (not timed)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case_in_process(json.loads(args.run_case), args.phases)))
+        return 0
+
+    formats = args.formats or available_formats()
+    # Generate (or reuse) the band rasters up front so no case times their creation
+    if {"index_def", "crate_zip"} & set(args.cases):
+        for size in args.sizes:
+            for fmt in formats:
+                ensure_bands(size, fmt)
+
+    results = []
+    for spec in case_specs(args.cases, args.sizes, formats):
+        print(f"Running {result_key(spec)} ...")
+        result = run_case(spec, args.phases)
+        print(f"  {result['seconds']}s, {result['megapixels_per_second']} Mpx/s, peak RSS {result['peak_rss_kb']} kB")
+        results.append(result)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    write_json(args.output, report)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        # Baselines are machine-specific, so none is committed
+        print(f"No baseline at {args.baseline}; skipping the regression comparison. "
+              f"Run `make bench-baseline` on the reference machine to record one.")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
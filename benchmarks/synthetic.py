@@ -0,0 +1,95 @@
+# synthetic.py
+#
+# Synthetic Sentinel-2-like band rasters for the benchmarks. Bands are
+# uint16, georeferenced on the T34TEQ UTM grid at the resolution matching
+# their size (10980² -> 10 m, 5490² -> 20 m, 1830² -> 60 m) and filled with
+# smooth, noisy reflectance-like values so codecs see realistic entropy.
+# Generated files are cached, so only the first run pays for them.
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+DATA_DIR = ".cache/benchmarks/data"
+SIZES = [10980, 5490, 1830]
+RESOLUTION = {10980: 10, 5490: 20, 1830: 60}
+# Upper-left corner of tile T34TEQ (EPSG:32634)
+ORIGIN = (499980.0, 5000040.0)
+CRS_UTM34N = CRS.from_epsg(32634)
+
+FORMATS = {
+    "GTiff": {"driver": "GTiff", "extension": ".tif", "options": {"tiled": True, "blockxsize": 512, "blockysize": 512}},
+    "JP2": {"driver": "JP2OpenJPEG", "extension": ".jp2", "options": {"quality": 100, "reversible": True}},
+}
+BAND_IDS = ["B03", "B08"]
+ROWS_PER_CHUNK = 1024
+
+
+def available_formats():
+    # JP2 depends on GDAL being built with OpenJPEG
+    with rasterio.Env() as env:
+        drivers = env.drivers()
+    return [name for name, spec in FORMATS.items() if spec["driver"] in drivers]
+
+
+def band_name(band_id, size, fmt):
+    # Follows the L2A naming index_def.gen_output_name expects (<tile>_<time>_<band>_<res>)
+    return f"T34TEQ_20150729T092006_{band_id}_{RESOLUTION[size]}m{FORMATS[fmt]['extension']}"
+
+
+def band_rows(band_id, size, row_start, rows, seed=0):
+    # Smooth field plus noise, in the 0-10000 reflectance range of L2A products
+    rng = np.random.default_rng(seed + row_start + (0 if band_id == "B03" else 7919))
+    y = np.arange(row_start, row_start + rows, dtype="f4")[:, None] / size
+    x = np.arange(size, dtype="f4")[None, :] / size
+    base = 0.5 + 0.25 * np.sin(6.28 * 3 * x) * np.cos(6.28 * 2 * y)
+    if band_id != "B03":
+        base = base * 1.6
+    noise = rng.normal(0, 0.03, (rows, size)).astype("f4")
+    return np.clip((base + noise) * 4000, 0, 10000).astype("uint16")
+
+
+def generate_band(path, band_id, size, fmt):
+    spec = FORMATS[fmt]
+    profile = {
+        "driver": spec["driver"],
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "uint16",
+        "crs": CRS_UTM34N,
+        "transform": from_origin(ORIGIN[0], ORIGIN[1], RESOLUTION[size], RESOLUTION[size]),
+        **spec["options"],
+    }
+    tmp_path = f"{path}.tmp{spec['extension']}"
+    if spec["driver"] == "GTiff":
+        # Written in row chunks so the largest size never needs a full-band buffer
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            for row in range(0, size, ROWS_PER_CHUNK):
+                rows = min(ROWS_PER_CHUNK, size - row)
+                dst.write(band_rows(band_id, size, row, rows)[None], window=((row, row + rows), (0, size)))
+    else:
+        # The JP2 driver is create-copy only, so the band is written in one go
+        data = np.vstack([
+            band_rows(band_id, size, row, min(ROWS_PER_CHUNK, size - row))
+            for row in range(0, size, ROWS_PER_CHUNK)
+        ])
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            dst.write(data[None])
+    os.replace(tmp_path, path)
+
+
+def ensure_bands(size, fmt, data_dir=DATA_DIR):
+    directory = os.path.join(data_dir, f"{size}_{fmt}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for band_id in BAND_IDS:
+        path = os.path.join(directory, band_name(band_id, size, fmt))
+        if not os.path.exists(path):
+            print(f"Generating {path}")
+            generate_band(path, band_id, size, fmt)
+        paths.append(os.path.abspath(path))
+    return paths
@@ -0,0 +1,141 @@
+# copernicus_client.py
+#
+# Shared Copernicus Data Space Ecosystem API client used by copernicus_data.py
+# and interface_crate.py. One pooled session per process, an OAuth token that
+# is reused (and refreshed) until it expires, and an on-disk cache of
+# product-name -> product record lookups shared between pipeline steps.
+
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TOKEN_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
+ODATA_PRODUCTS_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
+PRODUCT_CACHE_PATH = ".cache/copernicus_products.json"
+
+# Refresh tokens slightly before the server-side expiry
+TOKEN_EXPIRY_MARGIN = 30
+
+
+class CopernicusClient:
+    def __init__(self, username, password, cache_path=PRODUCT_CACHE_PATH, pool_size=8):
+        self.username = username
+        self.password = password
+        self.cache_path = cache_path
+
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=["GET", "HEAD"])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("https://", adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._refresh_token = None
+        self._refresh_expires_at = 0
+        self._products = self._load_cache()
+
+    # --- OAuth token handling ---
+
+    def _request_token(self, data):
+        data = dict(data, client_id="cdse-public")
+        r = self.session.post(TOKEN_URL, data=data)
+        try:
+            r.raise_for_status()
+        except Exception:
+            raise Exception(
+                f"Access token creation failed. Response from the server was: {r.text}"
+            )
+        payload = r.json()
+        now = time.monotonic()
+        self._token = payload["access_token"]
+        self._token_expires_at = now + payload.get("expires_in", 600) - TOKEN_EXPIRY_MARGIN
+        self._refresh_token = payload.get("refresh_token")
+        self._refresh_expires_at = now + payload.get("refresh_expires_in", 0) - TOKEN_EXPIRY_MARGIN
+
+    def get_access_token(self) -> str:
+        now = time.monotonic()
+        if self._token and now < self._token_expires_at:
+            return self._token
+        if self._refresh_token and now < self._refresh_expires_at:
+            try:
+                self._request_token({"grant_type": "refresh_token", "refresh_token": self._refresh_token})
+                return self._token
+            except Exception:
+                self._refresh_token = None
+        self._request_token({
+            "grant_type": "password",
+            "username": self.username,
+            "password": self.password,
+        })
+        return self._token
+
+    def auth_headers(self):
+        return {"Authorization": f"Bearer {self.get_access_token()}"}
+
+    def get(self, url, headers=None, **kwargs):
+        # Authorised GET through the pooled session; the token is refreshed as needed
+        merged = self.auth_headers()
+        merged.update(headers or {})
+        return self.session.get(url, headers=merged, **kwargs)
+
+    # --- Product lookups ---
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._products, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def get_product(self, product_name: str) -> dict:
+        if product_name in self._products:
+            return self._products[product_name]
+
+        params = {
+            "$filter": f"Name eq '{product_name}'",
+            "$top": 1
+        }
+        response = self.get(ODATA_PRODUCTS_URL, params=params)
+        response.raise_for_status()
+        results = response.json().get("value", [])
+
+        if not results:
+            raise Exception(f"No UUID found for product name: {product_name}")
+
+        product = {
+            "Id": results[0]["Id"],
+            "Checksum": results[0].get("Checksum", []),
+            "ContentLength": results[0].get("ContentLength"),
+        }
+        self._products[product_name] = product
+        self._save_cache()
+        return product
+
+    def get_uuid_from_product_name(self, product_name: str) -> str:
+        uuid = self.get_product(product_name)["Id"]
+        print(f"Found UUID for product {product_name}: {uuid}")
+        return uuid
+
+
+_client = None
+
+
+def get_client() -> CopernicusClient:
+    global _client
+    if _client is None:
+        from copernicus_token import COPERNICUS_USER, COPERNICUS_PASS
+        _client = CopernicusClient(COPERNICUS_USER, COPERNICUS_PASS)
+    return _client
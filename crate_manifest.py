@@ -0,0 +1,106 @@
+# crate_manifest.py
+#
+# Input manifests for the crate builders. A manifest records the SHA-256 of
+# every input file plus the generator parameters; when a rebuild would see
+# the same manifest as the last successful build, the builder can exit
+# early. File hashes are cached by path, size and mtime so unchanged inputs
+# are never re-read.
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_DIR = ".cache/manifests"
+HASH_CACHE_PATH = os.path.join(MANIFEST_DIR, "file_hashes.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashCache:
+    def __init__(self, path=HASH_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.entries = {}
+
+    def digest(self, path):
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        value = sha256_file(path)
+        with self.lock:
+            self.entries[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": value}
+        return value
+
+    def digest_many(self, paths, workers=None):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(paths, pool.map(self.digest, paths)))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Unique temporary file so concurrent savers never clobber each other
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self.lock:
+            entries = dict(self.entries)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def expand_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names)
+        elif os.path.exists(path):
+            files.append(path)
+    return sorted(os.path.normpath(f) for f in files)
+
+
+def build_manifest(paths, params=None, hash_cache=None):
+    hash_cache = hash_cache or HashCache()
+    files = hash_cache.digest_many(expand_inputs(paths))
+    hash_cache.save()
+    return {"params": params or {}, "files": files}
+
+
+def manifest_path(name):
+    return os.path.join(MANIFEST_DIR, f"{name}.json")
+
+
+def load_manifest(name):
+    path = manifest_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(name, manifest):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    with open(manifest_path(name), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def is_up_to_date(name, manifest, outputs):
+    if not all(os.path.exists(output) for output in outputs):
+        return False
+    return load_manifest(name) == manifest
@@ -0,0 +1,411 @@
+# crate_packaging.py
+#
+# Shared zip packaging for the crates. Each member is stored or deflated
+# depending on its type (already-compressed payloads such as JP2, JPG, PNG
+# and nested zips are stored as-is). Stored members are copied straight from
+# their source into the archive; deflated members are compressed ahead in a
+# bounded window of worker threads. Entries are written in sorted order with
+# fixed timestamps and permissions, so identical inputs always give
+# byte-identical archives. write_crate streams
+# an ro-crate-py crate into its zip directly from the entity sources.
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import crate_manifest
+from crate_sync import link_or_copy, sync_tree
+
+METADATA_FILE = "ro-crate-metadata.json"
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Formats that are compressed already and never shrink meaningfully
+STORED_EXTENSIONS = {".jp2", ".j2k", ".jpg", ".jpeg", ".png", ".gif", ".zip", ".gz", ".bz2", ".xz", ".zst", ".7z"}
+# Payloads whose compressibility depends on how they were written
+SAMPLED_EXTENSIONS = {".tif", ".tiff", ".pickle", ".pkl", ".npy"}
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+# Store a sampled member when deflate saves less than this fraction
+MIN_DEFLATE_SAVING = 0.05
+
+DEFLATE_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+# Compressed members are kept in memory up to this size, then spill to disk
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+EXTERNAL_ATTR = (0o100644 & 0xFFFF) << 16
+
+
+def dos_timestamp():
+    # Honour SOURCE_DATE_EPOCH for reproducible builds; default to the DOS epoch
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch is None:
+        return 0, (0 << 9) | (1 << 5) | 1
+    t = time.gmtime(max(int(epoch), 315532800))
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def choose_method(arcname, source):
+    ext = os.path.splitext(arcname)[1].lower()
+    if ext in STORED_EXTENSIONS:
+        return ZIP_STORED
+    if ext not in SAMPLED_EXTENSIONS:
+        return ZIP_DEFLATED
+    if isinstance(source, (bytes, bytearray)):
+        sample = bytes(source[:ENTROPY_SAMPLE_SIZE])
+    else:
+        with open(source, "rb") as f:
+            sample = f.read(ENTROPY_SAMPLE_SIZE)
+    if not sample:
+        return ZIP_STORED
+    saving = 1.0 - len(zlib.compress(sample, 1)) / len(sample)
+    return ZIP_DEFLATED if saving >= MIN_DEFLATE_SAVING else ZIP_STORED
+
+
+class PreparedEntry:
+    def __init__(self, arcname, method, crc, size, compressed_size, data):
+        self.arcname = arcname
+        self.method = method
+        self.crc = crc
+        self.size = size
+        self.compressed_size = compressed_size
+        self.data = data
+
+
+def iter_chunks(source):
+    if isinstance(source, (bytes, bytearray)):
+        view = memoryview(source)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+        return
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            yield chunk
+
+
+def source_size(source):
+    return len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+
+
+# Deflate one member into a spooled buffer (runs in a worker thread; zlib releases the GIL)
+def prepare_entry(arcname, source):
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    for chunk in iter_chunks(source):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        data.write(compressor.compress(chunk))
+    data.write(compressor.flush())
+    compressed_size = data.tell()
+    data.seek(0)
+    return PreparedEntry(arcname, ZIP_DEFLATED, crc, size, compressed_size, data)
+
+
+# Copy a stored member from its source straight into the archive in one read
+# pass; the CRC is only known afterwards, so it is patched into the header
+def write_stored_entry(out, arcname, source, dos_time, dos_date):
+    size = source_size(source)
+    entry = PreparedEntry(arcname, ZIP_STORED, 0, size, size, None)
+    offset = out.tell()
+    out.write(local_header(entry, dos_time, dos_date))
+    crc = 0
+    written = 0
+    for chunk in iter_chunks(source):
+        crc = zlib.crc32(chunk, crc)
+        written += len(chunk)
+        out.write(chunk)
+    if written != size:
+        raise Exception(f"{arcname} changed size while it was being zipped ({size} -> {written} bytes)")
+    entry.crc = crc
+    end = out.tell()
+    # The CRC-32 field follows signature, version, flags, method, time and date
+    out.seek(offset + 14)
+    out.write(struct.pack("<I", crc))
+    out.seek(end)
+    return entry
+
+
+def local_header(entry, dos_time, dos_date):
+    name = entry.arcname.encode("utf-8")
+    flags = 0x800 if not entry.arcname.isascii() else 0
+    extra = b""
+    size, compressed_size, version = entry.size, entry.compressed_size, 20
+    if entry.size > ZIP64_LIMIT or entry.compressed_size > ZIP64_LIMIT:
+        extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.compressed_size)
+        size = compressed_size = ZIP64_MARKER
+        version = 45
+    header = struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, version, flags, entry.method, dos_time, dos_date,
+        entry.crc, compressed_size, size, len(name), len(extra),
+    )
+    return header + name + extra
+
+
+def central_header(entry, offset, dos_time, dos_date):
+    name = entry.arcname.encode("utf-8")
+    flags = 0x800 if not entry.arcname.isascii() else 0
+    size, compressed_size, header_offset = entry.size, entry.compressed_size, offset
+    zip64_fields = []
+    if entry.size > ZIP64_LIMIT:
+        zip64_fields.append(entry.size)
+        size = ZIP64_MARKER
+    if entry.compressed_size > ZIP64_LIMIT:
+        zip64_fields.append(entry.compressed_size)
+        compressed_size = ZIP64_MARKER
+    if offset > ZIP64_LIMIT:
+        zip64_fields.append(offset)
+        header_offset = ZIP64_MARKER
+    extra = b""
+    version = 20
+    if zip64_fields:
+        extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields)
+        version = 45
+    header = struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, flags, entry.method,
+        dos_time, dos_date, entry.crc, compressed_size, size, len(name), len(extra), 0, 0, 0,
+        EXTERNAL_ATTR, header_offset,
+    )
+    return header + name + extra
+
+
+def end_of_central_directory(count, cd_offset, cd_size):
+    records = b""
+    if count > ZIP64_COUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+    records += struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+        cd_size if cd_size <= ZIP64_LIMIT else ZIP64_MARKER,
+        cd_offset if cd_offset <= ZIP64_LIMIT else ZIP64_MARKER, 0,
+    )
+    return records
+
+
+class ReusedEntry:
+    # A member copied verbatim (still compressed) from a previous archive
+    def __init__(self, info):
+        self.arcname = info.filename
+        self.method = info.compress_type
+        self.crc = info.CRC
+        self.size = info.file_size
+        self.compressed_size = info.compress_size
+        self.header_offset = info.header_offset
+
+    def copy_data(self, previous, out):
+        previous.seek(self.header_offset)
+        fixed = previous.read(30)
+        name_length, extra_length = struct.unpack("<HH", fixed[26:30])
+        previous.seek(self.header_offset + 30 + name_length + extra_length)
+        remaining = self.compressed_size
+        while remaining:
+            chunk = previous.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise EOFError(f"Truncated member {self.arcname} in previous archive")
+            out.write(chunk)
+            remaining -= len(chunk)
+
+
+# `entries` is an iterable of (arcname, source) where source is a path or bytes.
+# Members named in `reuse` are copied without recompression from `reuse_from`.
+def write_zip(zip_path, entries, workers=None, reuse_from=None, reuse=()):
+    entries = sorted(entries, key=lambda entry: entry[0])
+    for (arcname, _), (next_arcname, _) in zip(entries, entries[1:]):
+        if arcname == next_arcname:
+            raise Exception(f"Duplicate member {arcname} in {zip_path}")
+    # Same default as ThreadPoolExecutor; also the number of deflated members in flight
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    dos_time, dos_date = dos_timestamp()
+    central = []
+    reused = {}
+    if reuse_from and reuse and os.path.exists(reuse_from):
+        with zipfile.ZipFile(reuse_from) as previous_zip:
+            reused = {
+                info.filename: ReusedEntry(info)
+                for info in previous_zip.infolist() if info.filename in reuse
+            }
+
+    tmp_path = f"{zip_path}.tmp"
+    with open(tmp_path, "wb") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        previous = open(reuse_from, "rb") if reused else None
+        try:
+            fresh = [(arcname, source) for arcname, source in entries if arcname not in reused]
+            methods = dict(zip(
+                (arcname for arcname, _ in fresh),
+                pool.map(lambda entry: choose_method(*entry), fresh),
+            ))
+            # Deflated members are consumed in the order they are submitted, so
+            # keeping `workers` of them in flight bounds the spooled data
+            to_deflate = iter([entry for entry in fresh if methods[entry[0]] == ZIP_DEFLATED])
+            pending = {}
+
+            def submit_ahead():
+                while len(pending) < workers:
+                    entry = next(to_deflate, None)
+                    if entry is None:
+                        return
+                    pending[entry[0]] = pool.submit(prepare_entry, *entry)
+
+            for arcname, source in entries:
+                submit_ahead()
+                offset = out.tell()
+                if arcname in reused:
+                    entry = reused[arcname]
+                    out.write(local_header(entry, dos_time, dos_date))
+                    entry.copy_data(previous, out)
+                elif methods[arcname] == ZIP_STORED:
+                    entry = write_stored_entry(out, arcname, source, dos_time, dos_date)
+                else:
+                    entry = pending.pop(arcname).result()
+                    out.write(local_header(entry, dos_time, dos_date))
+                    shutil.copyfileobj(entry.data, out, CHUNK_SIZE)
+                    entry.data.close()
+                central.append(central_header(entry, offset, dos_time, dos_date))
+        finally:
+            if previous:
+                previous.close()
+
+        cd_offset = out.tell()
+        for header in central:
+            out.write(header)
+        out.write(end_of_central_directory(len(central), cd_offset, out.tell() - cd_offset))
+    os.replace(tmp_path, zip_path)
+    if reused:
+        print(f"Reused {len(reused)} of {len(entries)} unchanged members from {reuse_from}")
+    return zip_path
+
+
+def directory_entries(src_dir, include_root=False, exclude=()):
+    prefix = os.path.basename(os.path.normpath(src_dir)) if include_root else ""
+    entries = []
+    for root, _, files in os.walk(src_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, src_dir).replace(os.sep, "/")
+            if prefix:
+                arcname = f"{prefix}/{arcname}"
+            if any(fnmatch.fnmatch(arcname, pattern) for pattern in exclude):
+                continue
+            entries.append((arcname, file_path))
+    return entries
+
+
+# Write `entries`, skipping the work entirely when no member changed since the
+# last packaging and otherwise recompressing only the members that did change
+def update_zip(zip_path, entries, workers=None):
+    hash_cache = crate_manifest.HashCache()
+    paths = [source for _, source in entries if not isinstance(source, (bytes, bytearray))]
+    path_digests = hash_cache.digest_many(paths, workers)
+    hash_cache.save()
+    digests = {
+        arcname: hashlib.sha256(source).hexdigest() if isinstance(source, (bytes, bytearray)) else path_digests[source]
+        for arcname, source in entries
+    }
+
+    name = f"{os.path.basename(zip_path)}.members"
+    previous = crate_manifest.load_manifest(name) if os.path.exists(zip_path) else None
+    # Only trust the recorded members if the archive is still the one we wrote
+    if previous and previous.get("zip_size") != os.path.getsize(zip_path):
+        previous = None
+    previous_digests = (previous or {}).get("files", {})
+    if previous_digests == digests:
+        print(f"{zip_path} is up to date")
+        return zip_path
+
+    reuse = {arcname for arcname, digest in digests.items() if previous_digests.get(arcname) == digest}
+    write_zip(zip_path, entries, workers, reuse_from=zip_path, reuse=reuse)
+    crate_manifest.save_manifest(name, {"files": digests, "zip_size": os.path.getsize(zip_path)})
+    print(f"RO-Crate zipped to {zip_path}")
+    return zip_path
+
+
+def zip_directory(src_dir, zip_path=None, include_root=False, exclude=(), workers=None):
+    zip_path = zip_path or f"{os.path.normpath(src_dir)}.zip"
+    return update_zip(zip_path, directory_entries(src_dir, include_root, exclude), workers)
+
+
+def entity_types(entity):
+    types = entity.type
+    return types if isinstance(types, list) else [types]
+
+
+# ro-crate-metadata.json plus every local data entity, taken straight from its source
+def crate_entries(crate, extra_trees=None):
+    metadata = json.dumps(crate.metadata.generate(), indent=4, sort_keys=True).encode("utf-8")
+    entries = [(METADATA_FILE, metadata)]
+    for entity in crate.data_entities:
+        source = getattr(entity, "source", None)
+        if source is not None and os.path.isfile(source):
+            entries.append((entity.id, str(source)))
+        elif source is not None and os.path.isdir(source) and entity.id.rstrip("/") not in (extra_trees or {}):
+            # Only files are taken from entity sources; a directory dataset left
+            # out here would be a dangling data entity in the written crate
+            raise Exception(f"Dataset {entity.id} has source directory {source}; pass it in extra_trees")
+    # Directory datasets (e.g. nested crates) whose content comes from elsewhere
+    for arc_prefix, directory in (extra_trees or {}).items():
+        for arcname, path in directory_entries(directory):
+            entries.append((f"{arc_prefix}/{arcname}", path))
+    return entries
+
+
+def write_unpacked(crate, entries, unpacked_dir, extra_trees=None):
+    extra_prefixes = tuple(f"{prefix}/" for prefix in (extra_trees or {}))
+    os.makedirs(unpacked_dir, exist_ok=True)
+    for entity in crate.data_entities:
+        if "Dataset" in entity_types(entity) and getattr(entity, "source", None) is None:
+            os.makedirs(os.path.join(unpacked_dir, entity.id), exist_ok=True)
+    for arcname, source in entries:
+        if arcname.startswith(extra_prefixes):
+            continue
+        destination = os.path.join(unpacked_dir, *arcname.split("/"))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.lexists(destination):
+            os.remove(destination)
+        if isinstance(source, (bytes, bytearray)):
+            with open(destination, "wb") as f:
+                f.write(source)
+        else:
+            link_or_copy(source, destination)
+    for prefix, directory in (extra_trees or {}).items():
+        sync_tree(directory, os.path.join(unpacked_dir, prefix))
+
+
+# Serialize a crate straight into its zip in one pass over the sources, with
+# an optional unpacked directory built from links rather than copies
+def write_crate(crate, zip_path, unpacked_dir=None, extra_trees=None, workers=None):
+    entries = crate_entries(crate, extra_trees)
+    update_zip(zip_path, entries, workers)
+    if unpacked_dir is not None:
+        write_unpacked(crate, entries, unpacked_dir, extra_trees)
+        print(f"RO-Crate written to {unpacked_dir}")
+    return zip_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zip a crate directory deterministically")
+    parser.add_argument("directory")
+    parser.add_argument("-o", "--output", help="Zip path (defaults to <directory>.zip)")
+    parser.add_argument("--include-root", action="store_true",
+                        help="Prefix members with the directory name")
+    parser.add_argument("-x", "--exclude", action="append", default=[],
+                        help="Glob of member names to leave out (repeatable)")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    zip_directory(args.directory, args.output, args.include_root, args.exclude, args.workers)
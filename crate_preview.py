@@ -0,0 +1,276 @@
+# crate_preview.py
+#
+# In-process replacement for rochtml. Builds ro-crate-preview.html for a
+# crate straight from its ro-crate-metadata.json in a single pass over the
+# indexed graph, with the root dataset's name/description overrides applied
+# while the page is generated (so both the table view and the embedded
+# JSON-LD carry them). The page layout follows rochtml's static preview.
+#
+# Usage: python crate_preview.py CRATE_DIR [CRATE_DIR ...] [--name NAME] [--description TEXT]
+
+import argparse
+import html
+import json
+import os
+from urllib.parse import quote
+
+from provenance_index import CrateGraph, as_list
+
+PREVIEW_FILE = "ro-crate-preview.html"
+METADATA_FILE = "ro-crate-metadata.json"
+ROOT_ID = "./"
+
+# Root dataset name/description shown on the site for each of the pipeline's crates
+PREVIEW_OVERRIDES = {
+    "provenance_output.crate": {
+        "name": "Workflow Provenance Record (CWL Execution)",
+        "description": "Represents the provenance of the CWL workflow execution",
+    },
+    "interface.crate": {
+        "name": "LivePublication Experiment Interface Crate",
+        "description": "Containerises the Experiment Infrastructure outputs for LivePublication",
+    },
+    "publication.crate": {
+        "name": "LivePublication Crate",
+        "description": "A complete and reproducible LivePublication instance including data, workflow, and narrative.",
+    },
+}
+
+# Properties that are not defined by schema.org
+PROPERTY_DOCS = {
+    "conformsTo": "http://purl.org/dc/terms/conformsTo",
+}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".svg")
+
+PAGE_HEAD = """<html>
+<head>
+
+
+<script type="application/ld+json">
+{json_ld}
+</script>
+
+
+<!-- script src="https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js"></script -->
+<script src="https://unpkg.com/ro-crate-html-js/dist/ro-crate-dynamic.js"></script>
+
+<link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.2.1/css/bootstrap.min.css" integrity="sha384-GJzZqFGwb1QTTN6wy59ffF1BuGJpLSa9DkKMp0DgiMDm4iYMj70gZWKYbI706tWS" crossorigin="anonymous">
+
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css">
+
+<meta charset='utf-8'/>
+<style>
+
+table.table {{
+  padding-bottom: 300px;
+}}
+</style>
+</head>
+
+
+<body>
+
+  <nav class="navbar">
+
+    <ul class="nav navbar-nav" >
+        <li ><a href="#"><span class="glyphicon glyphicon-home dataset_name">&nbsp;</span></a></li>
+    </ul>
+
+  </nav>
+<div class="container">
+<div class="jumbotron">
+<h4 class="citation"></h4>
+<h3 class="item_name">{name}</h3>
+
+
+<a href="./{metadata_file}">⬇️🏷️ Download all the metadata for <span class='name'>{name}</span> in JSON-LD format</a>
+
+
+<div id="check"></div>
+
+
+</div>
+
+
+
+<div id="summary">
+<div class='all-meta'>
+"""
+
+PAGE_TAIL = """</div>
+</div>
+
+
+
+
+
+</body>
+</html>
+"""
+
+
+def apply_overrides(metadata, overrides):
+    # Copy the root entity rather than mutating the caller's graph
+    if not overrides:
+        return metadata
+    graph = []
+    for entity in metadata.get("@graph", []):
+        if entity.get("@id") == ROOT_ID:
+            entity = dict(entity)
+            entity.update({k: v for k, v in overrides.items() if v is not None})
+        graph.append(entity)
+    return dict(metadata, **{"@graph": graph})
+
+
+def is_url(value):
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+def anchor(entity_id):
+    return "#" + quote(entity_id, safe="/:.-_~")
+
+
+def entity_label(index, entity_id):
+    entity = index.get(entity_id)
+    if entity is not None and entity.get("name"):
+        return entity["name"]
+    return entity_id
+
+
+def render_value(index, value):
+    if isinstance(value, dict):
+        if "@id" in value:
+            target = value["@id"]
+            href = anchor(target) if target in index.by_id else target
+            return f'<a href="{html.escape(href, quote=True)}">{html.escape(str(entity_label(index, target)))}</a>'
+        return f"<span>{html.escape(json.dumps(value))}</span>"
+    if is_url(value):
+        return f'<a href="{html.escape(value, quote=True)}">{html.escape(value)}</a>'
+    return f"<span>{html.escape(str(value))}</span>"
+
+
+def render_cell(index, value):
+    values = as_list(value)
+    if len(values) == 1:
+        return render_value(index, values[0])
+    items = "\n                        \n".join(
+        f"                        <li>{render_value(index, v)}</li>" for v in values
+    )
+    return f"<ul>\n{items}\n                        </ul>"
+
+
+def property_header(prop):
+    if prop.startswith("@"):
+        return html.escape(prop)
+    doc = PROPERTY_DOCS.get(prop, f"http://schema.org/{prop}")
+    return f'{html.escape(prop)}<span>&nbsp;</span><a href="{doc}">[?]</a>'
+
+
+def property_row(prop, cell):
+    return f"""<tr>
+            <th style="text-align:left;" class="prop">{property_header(prop)}</th>
+            <td style='text-align:left'>{cell}</td>
+            </tr>"""
+
+
+def entity_heading(entity):
+    entity_id = entity["@id"]
+    label = html.escape(str(entity.get("name") or entity_id))
+    href = html.escape(entity_id, quote=True)
+    if is_url(entity_id):
+        return f'<a href="{href}">Go to: </a> {label}'
+    if "File" in as_list(entity.get("@type")) and not entity_id.startswith("#"):
+        return f'<a href="{href}">⬇️ Download: </a> {label}'
+    return f" {label}"
+
+
+def entity_preview(entity):
+    entity_id = entity["@id"]
+    if "File" not in as_list(entity.get("@type")) or is_url(entity_id):
+        return ""
+    encoding = str(entity.get("encodingFormat", ""))
+    if encoding.startswith("image/") or entity_id.lower().endswith(IMAGE_EXTENSIONS):
+        return f"<img width='100%' style='object-fit: contain' src='{html.escape(entity_id, quote=True)}'/>"
+    return ""
+
+
+def render_entity(index, entity):
+    rows = [
+        property_row(prop, render_cell(index, value)) for prop, value in entity.items()
+        if prop in ("@id", "@type") or not prop.startswith("@")
+    ]
+
+    # Reverse references come straight from the index instead of a graph scan
+    referrers = {}
+    for source, prop in index.referrers.get(entity["@id"], []):
+        referrers.setdefault(prop, []).append({"@id": source})
+    if referrers:
+        rows.append('<tr><th colspan="2" style="text-align:center">Items that reference this one</th><tr>')
+        rows.extend(property_row(prop, render_cell(index, sources)) for prop, sources in referrers.items())
+
+    return f"""           <div>
+            <h3>{entity_heading(entity)}</h3>
+
+            {entity_preview(entity)}
+
+
+        <div id="{html.escape(entity["@id"], quote=True)}">
+
+            <table class="table metadata table-striped" >
+                <tbody>{"".join(rows)}</tbody>
+            </table>
+        </div>
+
+        </div>
+        <hr/><br/><br/>"""
+
+
+def render_preview(metadata, overrides=None):
+    metadata = apply_overrides(metadata, overrides)
+    index = CrateGraph(metadata)
+    root = index.get(ROOT_ID, {})
+
+    # Keep "</script>" inside string values from closing the JSON-LD block
+    json_ld = json.dumps(metadata, indent=2, ensure_ascii=False).replace("</", "<\\/")
+    page = [PAGE_HEAD.format(
+        json_ld=json_ld,
+        name=html.escape(str(root.get("name", ""))),
+        metadata_file=METADATA_FILE,
+    )]
+    # Root dataset first, then the rest of the graph in order
+    ordered = sorted(index.graph, key=lambda e: e.get("@id") != ROOT_ID)
+    page.extend(render_entity(index, entity) for entity in ordered if "@id" in entity)
+    page.append(PAGE_TAIL)
+    return "\n".join(page)
+
+
+def write_preview(crate_dir, overrides=None):
+    crate_dir = os.path.normpath(crate_dir)
+    if overrides is None:
+        overrides = PREVIEW_OVERRIDES.get(os.path.basename(crate_dir))
+    with open(os.path.join(crate_dir, METADATA_FILE), "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    preview_path = os.path.join(crate_dir, PREVIEW_FILE)
+    # Replace rather than rewrite in place: the preview may be a hardlink shared
+    # with other crate trees through the blob store
+    tmp_path = f"{preview_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_preview(metadata, overrides))
+    os.replace(tmp_path, preview_path)
+    print(f"Preview written to {preview_path}")
+    return preview_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate ro-crate-preview.html for one or more crates.")
+    parser.add_argument("crates", nargs="+", help="Crate directories containing ro-crate-metadata.json")
+    parser.add_argument("--name", help="Override the root dataset name")
+    parser.add_argument("--description", help="Override the root dataset description")
+    args = parser.parse_args()
+
+    cli_overrides = None
+    if args.name or args.description:
+        cli_overrides = {"name": args.name, "description": args.description}
+    for crate in args.crates:
+        write_preview(crate, cli_overrides)
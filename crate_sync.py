@@ -0,0 +1,141 @@
+# crate_sync.py
+#
+# Incremental directory sync used when assembling crates. Unchanged files
+# are left alone, large payloads are shared through a content-addressed blob
+# store (reflink, then hardlink, falling back to a copy) and only changed or
+# new files are written. Blobs that no synced tree links to any more are
+# pruned after each sync.
+
+import hashlib
+import os
+import shutil
+import time
+
+BLOB_ROOT = ".cache/blobs"
+# Files below this size are cheaper to copy than to hash and link
+LINK_THRESHOLD = 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# Blobs linked or created this recently may still be in use by a concurrent sync
+PRUNE_GRACE_SECONDS = 3600
+
+# Linux FICLONE ioctl: copy-on-write clone on filesystems that support it
+FICLONE = 0x40049409
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink(src, dst):
+    import fcntl
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst):
+    try:
+        reflink(src, dst)
+        return "reflinked"
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "linked"
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copied"
+
+
+def store_blob(path, digest, blob_root=BLOB_ROOT):
+    blob = os.path.join(blob_root, digest[:2], digest)
+    if not os.path.exists(blob) or os.path.getsize(blob) != os.path.getsize(path):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_blob = f"{blob}.tmp"
+        link_or_copy(path, tmp_blob)
+        os.replace(tmp_blob, blob)
+    return blob
+
+
+def prune_blobs(blob_root=BLOB_ROOT, grace_seconds=PRUNE_GRACE_SECONDS):
+    # A blob with a single link is no longer hardlinked into any tree. Reflinked
+    # and copied trees own their data, so dropping the blob never affects them.
+    removed = 0
+    freed = 0
+    cutoff = time.time() - grace_seconds
+    if not os.path.isdir(blob_root):
+        return removed, freed
+    for root, dirs, files in os.walk(blob_root, topdown=False):
+        for file in files:
+            path = os.path.join(root, file)
+            stat = os.stat(path)
+            # st_ctime changes whenever a link to the blob is added or removed
+            if stat.st_nlink <= 1 and stat.st_ctime < cutoff:
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+        if root != blob_root and not os.listdir(root):
+            os.rmdir(root)
+    return removed, freed
+
+
+def unchanged(src, dst):
+    if not os.path.isfile(dst):
+        return False
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    # copy2 and copystat preserve nanosecond mtimes; anything else is checked by content
+    if os.path.samestat(src_stat, dst_stat) or src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    return file_digest(src) == file_digest(dst)
+
+
+def sync_tree(src_dir, dst_dir, blob_root=BLOB_ROOT, link_threshold=LINK_THRESHOLD, exclude=None):
+    stats = {"unchanged": 0, "reflinked": 0, "linked": 0, "copied": 0, "removed": 0}
+    wanted = set()
+
+    for root, _, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        os.makedirs(os.path.join(dst_dir, rel_root), exist_ok=True)
+        for file in files:
+            rel_path = os.path.normpath(os.path.join(rel_root, file))
+            if exclude is not None and exclude(rel_path):
+                continue
+            wanted.add(rel_path)
+            src = os.path.join(src_dir, rel_path)
+            dst = os.path.join(dst_dir, rel_path)
+            if unchanged(src, dst):
+                stats["unchanged"] += 1
+                continue
+            # Never write through an existing (possibly shared) file
+            if os.path.lexists(dst):
+                os.remove(dst)
+            if os.path.getsize(src) >= link_threshold:
+                blob = store_blob(src, file_digest(src), blob_root)
+                stats[link_or_copy(blob, dst)] += 1
+            else:
+                shutil.copy2(src, dst)
+                stats["copied"] += 1
+
+    # Drop files that no longer exist in the source, then empty directories
+    for root, dirs, files in os.walk(dst_dir, topdown=False):
+        for file in files:
+            rel_path = os.path.normpath(os.path.relpath(os.path.join(root, file), dst_dir))
+            if rel_path not in wanted:
+                os.remove(os.path.join(root, file))
+                stats["removed"] += 1
+        if root != dst_dir and not os.listdir(root):
+            os.rmdir(root)
+
+    pruned, freed = prune_blobs(blob_root)
+    if pruned:
+        print(f"Pruned {pruned} unreferenced blobs from {blob_root} ({freed / 1e6:.1f} MB)")
+
+    print(f"Synced {src_dir} -> {dst_dir}: {stats}")
+    return stats
@@ -1,112 +1,136 @@
-import os
-from jinja2 import Environment, FileSystemLoader
+import hashlib
 import json
-import re
-import html
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+TEMPLATE_DIR = "docs/templates"
+TEMPLATE_NAME = "base.html"
+# Compiled templates and the per-page input hashes of the last build
+BYTECODE_CACHE_DIR = ".cache/jinja"
+BUILD_STATE_PATH = ".cache/site_build.json"
+
+PAGES = [
+    {
+        "input": "provenance_output.crate/ro-crate-preview.html",
+        "output": "docs/provenance.html",
+        "title": "Provenance Crate"
+    },
+    {
+        "input": "interface.crate/ro-crate-preview.html",
+        "output": "docs/interface.html",
+        "title": "Interface Crate"
+    },
+    {
+        "input": "provenance_output.crate/ro-crate-preview.html",
+        "output": "docs/index.html",
+        "title": "Provenance Crate"
+    },
+    {
+        "input": "publication.crate/ro-crate-preview.html",
+        "output": "docs/publication.html",
+        "title": "LivePublication Crate"
+    },
+    # Research article as a standalone page
+    {
+        "input": "docs/publication/research_article.html",
+        "output": "docs/research_article.html",
+        "title": "Research Article"
+    }
+]
+
 
-def update_description_and_name_in_preview(crate_html_path, new_description):
-    with open(crate_html_path, "r", encoding="utf-8") as f:
-        content = f.read()
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
 
-    # Find the JSON-LD script block
-    match = re.search(r'<script type="application/ld\+json">(.*?)</script>', content, re.DOTALL)
-    if not match:
-        return
 
-    raw_json = html.unescape(match.group(1)).strip()
-    raw_json = re.sub(r'[\x00-\x1F\x7F]', '', raw_json)
+def make_environment(template_dir=TEMPLATE_DIR, cache_dir=BYTECODE_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+    )
+
+
+def template_hash(template_dir=TEMPLATE_DIR):
+    # Any template change (including includes/extends) invalidates every page
+    digest = hashlib.sha256()
+    for root, _, names in sorted(os.walk(template_dir)):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, template_dir).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_build_state(path=BUILD_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
     try:
-        decoded_json = json.loads(raw_json)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON-LD from {crate_html_path}:\n{e}")
-        print("Offending JSON snippet:")
-        print(raw_json[:500])
-        return
-    for entity in decoded_json.get("@graph", []):
-        if entity.get("@id") == "./":
-            entity["description"] = new_description
-            if "provenance_output.crate" in crate_html_path:
-                entity["name"] = "Workflow Provenance Record (CWL Execution)"
-            elif "interface.crate" in crate_html_path:
-                entity["name"] = "LivePublication Experiment Interface Crate"
-            elif "publication.crate" in crate_html_path:
-                entity["name"] = "LivePublication Crate"
-            break
-
-    updated_json_str = json.dumps(decoded_json, indent=2)
-    updated_script = f'<script type="application/ld+json">\n{updated_json_str}\n</script>'
-    content = re.sub(r'<script type="application/ld\+json">.*?</script>', updated_script, content, flags=re.DOTALL)
-
-    with open(crate_html_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def render_crate_page(crate_html_path, output_html_path, title, content_override=None):
-    if content_override is not None:
-        crate_html = content_override
-    else:
-        with open(crate_html_path, "r", encoding="utf-8") as f:
-            crate_html = f.read()
-
-    env = Environment(loader=FileSystemLoader("docs/templates"))
-    template = env.get_template("base.html")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_build_state(state, path=BUILD_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def render_crate_page(template, crate_html, output_html_paths, title):
     rendered = template.render(title=title, content=crate_html)
+    for output_html_path in output_html_paths:
+        with open(output_html_path, "w", encoding="utf-8") as f:
+            f.write(rendered)
+
+
+def build_site(pages=PAGES, workers=None, force=False):
+    env = make_environment()
+    # Compiled once (or loaded from the bytecode cache) and shared by every page
+    template = env.get_template(TEMPLATE_NAME)
+    templates_digest = template_hash()
+    previous = {} if force else load_build_state()
+    state = {}
+
+    # Read each distinct input once, however many pages use it
+    contents = {}
+    for page in pages:
+        if page["input"] in contents:
+            continue
+        if not os.path.exists(page["input"]):
+            print(f"Warning: {page['input']} does not exist.")
+            continue
+        with open(page["input"], "rb") as f:
+            contents[page["input"]] = f.read()
+
+    # Group pages that would render identically (same input and title)
+    jobs = {}
+    for page in pages:
+        if page["input"] not in contents:
+            continue
+        key = {"input": sha256_bytes(contents[page["input"]]), "title": page["title"], "templates": templates_digest}
+        state[page["output"]] = key
+        if previous.get(page["output"]) == key and os.path.exists(page["output"]):
+            print(f"Unchanged: {page['output']}")
+            continue
+        jobs.setdefault((page["input"], page["title"]), []).append(page["output"])
+
+    def render(job):
+        (input_path, title), outputs = job
+        render_crate_page(template, contents[input_path].decode("utf-8"), outputs, title)
+        print(f"Rendered {input_path} -> {', '.join(outputs)}")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() surfaces exceptions from the workers
+        list(pool.map(render, jobs.items()))
+
+    save_build_state(state)
 
-    with open(output_html_path, "w", encoding="utf-8") as f:
-        f.write(rendered)
 
 if __name__ == "__main__":
-    crates = [
-        {
-            "input": "provenance_output.crate/ro-crate-preview.html",
-            "output": "docs/provenance.html",
-            "title": "Provenance Crate"
-        },
-        {
-            "input": "interface.crate/ro-crate-preview.html",
-            "output": "docs/interface.html",
-            "title": "Interface Crate"
-        },
-        {
-            "input": "provenance_output.crate/ro-crate-preview.html",
-            "output": "docs/index.html",
-            "title": "Provenance Crate"
-        },
-        {
-            "input": "publication.crate/ro-crate-preview.html",
-            "output": "docs/publication.html",
-            "title": "LivePublication Crate"
-        }
-    ]
-
-    for crate in crates:
-        if os.path.exists(crate["input"]):
-            if "provenance_output.crate" in crate["input"]:
-                update_description_and_name_in_preview(crate["input"], "Represents the provenance of the CWL workflow execution")
-            elif "interface.crate" in crate["input"]:
-                update_description_and_name_in_preview(crate["input"], "Containerises the Experiment Infrastructure outputs for LivePublication")
-            elif "publication.crate" in crate["input"]:
-                update_description_and_name_in_preview(crate["input"], "A complete and reproducible LivePublication instance including data, workflow, and narrative.")
-
-            render_crate_page(crate["input"], crate["output"], crate["title"])
-        else:
-            print(f"Warning: {crate['input']} does not exist.")
-
-    # Render research article as a standalone page
-    research_article_input = "docs/publication/research_article.html"
-    research_article_output = "docs/research_article.html"
-    if os.path.exists(research_article_input):
-        try:
-            with open(research_article_input, "r", encoding="utf-8") as rf:
-                article_html = rf.read()
-            alert_html = (
-                '<div class="alert-warning" style="border:1px solid #f5c6cb; background:#f8d7da; padding:10px; margin-bottom:20px;">'
-                '<strong>Note:</strong> This embedded article is currently broken and waiting on downstream development.'
-                '</div>'
-            )
-            # Removed alert_html from the article content as it is now rendering correctly. 
-            full_content = article_html
-            render_crate_page(research_article_input, research_article_output, "Research Article", content_override=full_content)
-        except Exception as e:
-            print(f"Warning: Could not render research article: {e}")
-    else:
-        print(f"Warning: {research_article_input} does not exist.")
\ No newline at end of file
+    # Name/description overrides are applied when crate_preview.py writes the previews
+    build_site(force="--force" in sys.argv[1:])
@@ -1,4 +1,4 @@
-import requests
+import glob
 import json
 from datetime import datetime, timezone
 
@@ -8,60 +8,31 @@ from rocrate.model.contextentity import ContextEntity
 import shutil
 import os
 
+from copernicus_client import get_client
+import product_store
+from crate_packaging import write_crate
+from crate_manifest import build_manifest, is_up_to_date, save_manifest
+from safe_extract import SAFE_METADATA_FILES
 
-# Copernicus Data Space Ecosystem API helpers
-def get_access_token(username: str, password: str) -> str:
-    data = {
-        "client_id": "cdse-public",
-        "username": username,
-        "password": password,
-        "grant_type": "password",
-    }
-    try:
-        r = requests.post(
-            "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token",
-            data=data,
-        )
-        r.raise_for_status()
-    except Exception as e:
-        raise Exception(
-            f"Access token creation failed. Response from the server was: {r.json()}"
-        )
-    return r.json()["access_token"]
-
-def get_uuid_from_product_name(product_name: str, token: str) -> str:
-    url = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {
-        "$filter": f"Name eq '{product_name}'",
-        "$top": 1
-    }
-
-    response = requests.get(url, headers=headers, params=params)
-    response.raise_for_status()
-    results = response.json().get("value", [])
-
-    if not results:
-        raise Exception(f"No UUID found for product name: {product_name}")
-
-    print(f"Found UUID for product {product_name}: {results[0]['Id']}")
-
-    return results[0]["Id"]
+# pipeline.py rewrites the live trace after every stage, so the crate is built
+# from a copy taken once it is known to need rebuilding. The trace is volatile
+# (new timings every run) and is not part of the manifest; an up-to-date crate
+# keeps the trace of the run that built it.
+TRACE_PATH = "pipeline_trace.json"
+TRACE_SNAPSHOT = ".cache/interface_trace/pipeline_trace.json"
 
 
 def encode_e1_data_producer(crate):
-    import glob
-
     # Find the .SAFE data product directory dynamically
     safe_dirs = glob.glob("Workflow_inputs/Data/*.SAFE")
     if not safe_dirs:
         raise Exception("No .SAFE directories found in Workflow_inputs/Data/")
-    safe_dir = safe_dirs[0]
-    safe_name = os.path.basename(safe_dir)
+    safe_name = os.path.basename(safe_dirs[0])
+    # The entry in Workflow_inputs/Data is a link into the local product store
+    safe_dir = product_store.resolve(safe_dirs[0])
 
-    import copernicus_token  # assuming your tokens are stored here
-    token = get_access_token(copernicus_token.COPERNICUS_USER, copernicus_token.COPERNICUS_PASS)
-    uuid = get_uuid_from_product_name(safe_name, token)
+    # Reuses the product lookup cached by copernicus_data.py, so no extra login
+    uuid = get_client().get_uuid_from_product_name(safe_name)
 
     catalog = crate.add(ContextEntity(crate, "https://dataspace.copernicus.eu/", properties={
         "@type": "DataCatalog",
@@ -90,7 +61,7 @@ def encode_e1_data_producer(crate):
     }))
 
     # Expected metadata files and a single JPG file inside the SAFE directory
-    metadata_files = ["INSPIRE.xml", "manifest.safe", "MTD_MSIL2A.xml"]
+    metadata_files = SAFE_METADATA_FILES
     image_files = glob.glob(os.path.join(safe_dir, "*.jpg"))
     if not image_files:
         raise Exception("No .jpg image found in the SAFE directory.")
@@ -151,9 +122,19 @@ def encode_e2_1_workflow_infrastructure(crate):
     # Link the container as a part of the E2.1 dataset
     e2_1["hasPart"] = [dockerfile_entity, docker_entity]
 
+    # Performance profile of the pipeline run that built this crate (written by pipeline.py)
+    if os.path.exists(TRACE_SNAPSHOT):
+        trace_entity = crate.add_file(TRACE_SNAPSHOT, dest_path=os.path.basename(TRACE_SNAPSHOT), properties={
+            "encodingFormat": "application/json",
+            "name": "Publish Pipeline Performance Trace",
+            "description": "Wall time, CPU time, peak RSS and block I/O for every publish pipeline stage and child process up to the building of this crate, in Chrome trace format.",
+            "about": e2_1
+        })
+        e2_1["hasPart"] = [dockerfile_entity, docker_entity, trace_entity]
+
     return e2_1
 
-def encode_e2_2_wms(crate, output_dir):
+def encode_e2_2_wms(crate):
     e2_2 = crate.add(ContextEntity(crate, "#E2.2-wms", properties={
         "@type": "Dataset",
         "name": "E2.2: Workflow Management System",
@@ -164,10 +145,7 @@ def encode_e2_2_wms(crate, output_dir):
     if not os.path.isdir(prov_crate_path):
         raise Exception(f"{prov_crate_path} directory is missing.")
 
-    # Copy the provenance_output.crate into the main RO-Crate output directory
-    dst_path = os.path.join(output_dir, os.path.basename(prov_crate_path))
-    shutil.copytree(prov_crate_path, dst_path)
-
+    # The directory's content is streamed from prov_crate_path by write_crate
     nested_prov = crate.add(Dataset(crate, os.path.basename(prov_crate_path), properties={
         "name": "Provenance Run Crate",
         "description": "Nested RO-Crate containing workflow execution provenance.",
@@ -210,6 +188,19 @@ def encode_e3_experimental_results(crate):
         ]
     }))
     e3["hasPart"] = [zenodo_entity]
+
+    # Change statistics against the previous scene of the tile (written by change_detection.py)
+    change_summary_path = "change_detection/change_summary.json"
+    if os.path.exists(change_summary_path):
+        with open(change_summary_path, "r", encoding="utf-8") as f:
+            change_summary = json.load(f)
+        change_entity = crate.add_file(change_summary_path, properties={
+            "encodingFormat": "application/json",
+            "name": "Change Detection Summary",
+            "description": f"Index change between {os.path.basename(change_summary['before'])} and {os.path.basename(change_summary['after'])}: gain/loss pixel counts, areas and delta statistics at a threshold of {change_summary['threshold']}.",
+            "about": e3
+        })
+        e3["hasPart"] = [zenodo_entity, change_entity]
     return e3
 
 
@@ -228,7 +219,7 @@ def create_interface_crate(output_dir: str):
     # Define dummy components for E1–E3
     e1 = encode_e1_data_producer(crate)
     e2_1 = encode_e2_1_workflow_infrastructure(crate)
-    e2_2 = encode_e2_2_wms(crate, output_dir)
+    e2_2 = encode_e2_2_wms(crate)
     e3 = encode_e3_experimental_results(crate)
 
     # Link these components to the mainEntity
@@ -236,23 +227,56 @@ def create_interface_crate(output_dir: str):
 
     crate.mainEntity = main_entity
 
-    # Write the RO-Crate to the specified output directory
-    crate.write(output_dir)
-
-    import zipfile
-
-    zip_path = f"{output_dir}.zip"
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(output_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, output_dir)
-                zipf.write(file_path, arcname)
-    print(f"RO-Crate zipped to {zip_path}")
+    # Stream the RO-Crate into its zip and link the unpacked copy into output_dir,
+    # sharing unchanged provenance payloads instead of copying them again
+    write_crate(
+        crate, f"{output_dir}.zip", unpacked_dir=output_dir,
+        extra_trees={"provenance_output.crate": "provenance_output.crate"},
+    )
+
+
+def snapshot_trace(trace_path=TRACE_PATH, snapshot_path=TRACE_SNAPSHOT):
+    # Replace rather than overwrite: the previous snapshot may be linked into interface.crate
+    if not os.path.exists(trace_path):
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        return None
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    tmp_path = f"{snapshot_path}.tmp"
+    shutil.copyfile(trace_path, tmp_path)
+    os.replace(tmp_path, snapshot_path)
+    return snapshot_path
+
+
+# Input files and generator parameters that determine the interface crate
+def interface_crate_manifest():
+    inputs = [__file__, "Dockerfile", "provenance_output.crate", "change_detection/change_summary.json"]
+    params = {}
+    safe_dirs = glob.glob("Workflow_inputs/Data/*.SAFE")
+    if safe_dirs:
+        safe_dir = product_store.resolve(safe_dirs[0])
+        inputs += [os.path.join(safe_dir, name) for name in SAFE_METADATA_FILES]
+        inputs += glob.glob(os.path.join(safe_dir, "*.jpg"))
+        params["product"] = os.path.basename(safe_dirs[0])
+    return build_manifest(inputs, params)
 
 
 if __name__ == "__main__":
     crate_name = "interface.crate"
-    if os.path.exists(crate_name):
-      shutil.rmtree(crate_name)
-    create_interface_crate(crate_name)
+    manifest = interface_crate_manifest()
+    if is_up_to_date(crate_name, manifest, [crate_name, f"{crate_name}.zip"]):
+      print(f"{crate_name} is up to date; skipping rebuild")
+    else:
+      # Keep the nested provenance crate so it can be synced incrementally
+      if os.path.exists(crate_name):
+        for entry in os.listdir(crate_name):
+          path = os.path.join(crate_name, entry)
+          if entry == "provenance_output.crate":
+            continue
+          if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+          else:
+            os.remove(path)
+      snapshot_trace()
+      create_interface_crate(crate_name)
+      save_manifest(crate_name, manifest)
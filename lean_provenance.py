@@ -0,0 +1,179 @@
+# lean_provenance.py
+#
+# Lean provenance: large payloads of a Provenance Run Crate (the JP2 band
+# inputs, the index pickle and the GeoTIFF) are removed from the crate and
+# recorded by checksum, size and, where one exists, an external URL instead:
+# bands point at their file inside the Copernicus OData product (when the
+# product record is in the local Copernicus cache); the GeoTIFF keeps a
+# checksum identifier and is linked to the Zenodo concept record it is
+# published in. The entity @ids and every reference to them
+# are rewritten, so the crate (and the interface crate nesting it) stays
+# small. Runs only when the CWL job sets lean_provenance; with it unset the
+# crate keeps every payload (full mode).
+#
+# Usage: python lean_provenance.py CRATE_DIR [--job Workflow_inputs/GNDVI_10m.yaml]
+
+import argparse
+import hashlib
+import json
+import os
+
+import yaml
+
+from copernicus_client import PRODUCT_CACHE_PATH
+from crate_sync import HASH_CHUNK_SIZE
+from zenodo_upload import CONCEPT_RECORD_ID
+
+METADATA_FILE = "ro-crate-metadata.json"
+JOB_PATH = "Workflow_inputs/GNDVI_10m.yaml"
+# Payloads at or above this size are referenced instead of embedded
+LEAN_SIZE_THRESHOLD = 1024 * 1024
+
+ODATA_DOWNLOAD_URL = "https://download.dataspace.copernicus.eu/odata/v1/Products"
+# zenodo_upload.py publishes each run's GeoTIFF as a new version of this
+# concept record. The version does not exist yet when this crate is built, and
+# the concept DOI always resolves to the newest one, so it is only used as
+# isPartOf; the file itself is identified by its checksum.
+ZENODO_CONCEPT_DOI = f"https://doi.org/10.5281/zenodo.{CONCEPT_RECORD_ID}"
+# Formal parameter of the workflow output published on Zenodo
+ZENODO_OUTPUT = "packed.cwl#main/tiff"
+
+
+def load_job(job_path):
+    with open(job_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def sha1_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_product_uuid(safe_name, cache_path=PRODUCT_CACHE_PATH):
+    # Product records cached by copernicus_client.py when the data was fetched,
+    # read directly so this step needs no credentials or network access
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            products = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    for name in (safe_name, safe_name[:-len(".SAFE")]):
+        if name in products:
+            return products[name].get("Id")
+    return None
+
+
+def band_urls(job, cache_path=PRODUCT_CACHE_PATH):
+    # Map each band file name to its node inside the Copernicus product; bands
+    # whose product is not in the cache are recorded by checksum only
+    urls = {}
+    for band in job.get("bands", []):
+        parts = band["path"].replace("\\", "/").split("/")
+        safe_index = next((i for i, part in enumerate(parts) if part.endswith(".SAFE")), None)
+        if safe_index is None:
+            continue
+        safe_name = parts[safe_index]
+        uuid = cached_product_uuid(safe_name, cache_path)
+        if uuid is None:
+            print(f"No cached product record for {safe_name}; recording {parts[-1]} by checksum only")
+            continue
+        nodes = "/".join(f"Nodes({part})" for part in parts[safe_index:])
+        urls[parts[-1]] = {
+            "url": f"{ODATA_DOWNLOAD_URL}({uuid})/{nodes}/$value",
+            "product": f"{ODATA_DOWNLOAD_URL}({uuid})/$value",
+        }
+    return urls
+
+
+def external_reference(entity, bands):
+    name = entity.get("alternateName", entity["@id"])
+    if name in bands:
+        return bands[name]["url"], {"isPartOf": {"@id": bands[name]["product"]}}
+    work = entity.get("exampleOfWork", [])
+    if any(ref.get("@id") == ZENODO_OUTPUT for ref in (work if isinstance(work, list) else [work])):
+        return None, {"isPartOf": {"@id": ZENODO_CONCEPT_DOI}}
+    # Intermediates have no public copy; they are reproducible from the workflow
+    return None, {}
+
+
+def rewrite_references(value, renamed):
+    if isinstance(value, list):
+        return [rewrite_references(item, renamed) for item in value]
+    if isinstance(value, dict):
+        if set(value) == {"@id"}:
+            return {"@id": renamed.get(value["@id"], value["@id"])}
+        return {key: rewrite_references(item, renamed) for key, item in value.items()}
+    return value
+
+
+def externalize(crate_dir, bands, threshold=LEAN_SIZE_THRESHOLD):
+    metadata_path = os.path.join(crate_dir, METADATA_FILE)
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    renamed = {}
+    removed = []
+    for entity in metadata["@graph"]:
+        types = entity.get("@type", [])
+        types = types if isinstance(types, list) else [types]
+        path = os.path.join(crate_dir, entity["@id"])
+        if "File" not in types or "://" in entity["@id"] or not os.path.isfile(path):
+            continue
+        size = os.path.getsize(path)
+        if size < threshold:
+            continue
+
+        entity.setdefault("contentSize", str(size))
+        entity.setdefault("sha1", sha1_digest(path))
+        url, extra = external_reference(entity, bands)
+        if url:
+            entity["contentUrl"] = url
+            new_id = url
+        else:
+            entity["description"] = "Not embedded in this lean provenance crate; identified by its checksum and size."
+            # The original name keeps byte-identical payloads as separate entities
+            new_id = f"#{entity['@id']}@sha1:{entity['sha1']}"
+        entity.update(extra)
+        renamed[entity["@id"]] = new_id
+        removed.append(path)
+
+    if not renamed:
+        print(f"{crate_dir}: no payloads above {threshold} bytes")
+        return []
+
+    metadata["@graph"] = [
+        dict(rewrite_references(entity, renamed), **{"@id": renamed.get(entity["@id"], entity["@id"])})
+        for entity in metadata["@graph"]
+    ]
+    tmp_path = f"{metadata_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(tmp_path, metadata_path)
+
+    for path in removed:
+        os.remove(path)
+    saved = sum(int(e.get("contentSize", 0)) for e in metadata["@graph"] if e["@id"] in renamed.values())
+    print(f"{crate_dir}: referenced {len(removed)} payloads externally ({saved / 1e6:.1f} MB not embedded)")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace large crate payloads with checksummed external references.")
+    parser.add_argument("crate_dir")
+    parser.add_argument("--job", default=JOB_PATH, help="CWL job file; lean mode is enabled by its lean_provenance flag")
+    parser.add_argument("--threshold", type=int, default=LEAN_SIZE_THRESHOLD)
+    args = parser.parse_args()
+
+    job = load_job(args.job)
+    if not job.get("lean_provenance"):
+        print(f"lean_provenance is not set in {args.job}; keeping every payload in {args.crate_dir}")
+        return
+
+    externalize(args.crate_dir, band_urls(job), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+# pipeline.py
+#
+# Dependency-aware runner for the publish pipeline. Every step declares the
+# files it reads, the files it writes and the shell command(s) that produce
+# them; dependencies between steps are derived from those paths. A step is
+# skipped when the fingerprint of its inputs and commands matches the last
+# successful run and its outputs still exist, and steps whose dependencies
+# are done run concurrently under a worker limit. Wall time, CPU time, peak
+# RSS and block I/O of every step and child process are written to
+# pipeline_trace.json (Chrome trace format, viewable in chrome://tracing or
+# Perfetto) as the run progresses.
+#
+# Usage: python pipeline.py [TARGET ...] [--clean] [--force] [-j N] [--dry-run] [--list]
+# The default target (publish) runs the same steps as publish_pipeline.sh.
+
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from crate_manifest import HashCache, build_manifest, is_up_to_date, save_manifest
+
+DEFAULT_TARGET = "publish"
+DEFAULT_WORKERS = 4
+TRACE_PATH = "pipeline_trace.json"
+# ru_inblock/ru_oublock count 512-byte blocks
+BLOCK_SIZE = 512
+
+# Everything --clean removes: the same set publish_pipeline.sh used to delete up front
+CLEAN_PATHS = [
+    # Workflow_inputs/Data only holds links into the product store (.cache/products)
+    "Workflow_inputs/Data/*",
+    "*.pickle",
+    "*.tif",
+    "*_profile.json",
+    "change_detection",
+    "interface.crate",
+    "provenance_output",
+    "provenance_output.crate",
+    "publication.crate",
+    "DNF_document.json",
+    "dynamic_article.json",
+    "docs/publication",
+    "*.zip",
+    ".cache/manifests/pipeline-*.json",
+]
+
+
+class Step:
+    def __init__(self, name, commands, inputs=(), outputs=(), clean=(), after=(), always=False, label=None):
+        self.name = name
+        self.commands = [commands] if isinstance(commands, str) else list(commands)
+        # Paths or glob patterns
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        # Removed before the step runs
+        self.clean = list(clean)
+        # Ordering constraints that are not visible through files
+        self.after = list(after)
+        # Reads remote state, so it can never be considered up to date
+        self.always = always
+        self.label = label or name
+
+
+STEPS = [
+    # Asks the catalogue which scene is best; the selection file only changes
+    # when the choice does, so an unchanged selection skips everything below
+    Step("select_data", "python copernicus_data.py --select",
+         inputs=["copernicus_data.py", "scene_selection.py", "stac_catalog.py"],
+         outputs=[".cache/selected_products.json"],
+         always=True,
+         label="🛰️ Selecting the best Copernicus scene"),
+    Step("fetch_data", "python copernicus_data.py --fetch",
+         inputs=["copernicus_data.py", ".cache/selected_products.json"],
+         outputs=["Workflow_inputs/GNDVI_10m.yaml", "Workflow_inputs/Data"],
+         clean=["Workflow_inputs/Data/*"],
+         label="🛰️ Fetching the selected product and patching workflow input"),
+    Step("run_workflow",
+         "cwltool --strict-memory-limit --provenance provenance_output Workflows/workflow.cwl Workflow_inputs/GNDVI_10m.yaml",
+         inputs=["Workflows", "Workflow_inputs/GNDVI_10m.yaml"],
+         outputs=["provenance_output", "*.tif"],
+         clean=["provenance_output", "*.pickle", "*.tif", "*_profile.json"],
+         label="▶️ Running CWL workflow"),
+    # Compares the new index raster with the latest earlier scene of the same tile
+    # kept in .cache/index_history; writes nothing on the first run for a tile
+    Step("change_detection",
+         # The quoted pattern is resolved by the script, which requires exactly one match
+         "python Workflows/Modules/Scripts/change_detection.py -a '*.index.tif' --history .cache/index_history -o change_detection",
+         inputs=["Workflows/Modules/Scripts/change_detection.py", "*.index.tif"],
+         outputs=["change_detection/change_summary.json"],
+         clean=["change_detection"],
+         label="🔀 Detecting changes since the previous scene"),
+    Step("provenance_crate", [
+            "runcrate convert provenance_output --output provenance_output.crate",
+            # No-op unless the job sets lean_provenance
+            "python lean_provenance.py provenance_output.crate",
+            'python crate_packaging.py provenance_output.crate --include-root --exclude "*.zip"',
+         ],
+         inputs=["provenance_output", "lean_provenance.py", "Workflow_inputs/GNDVI_10m.yaml", "crate_packaging.py"],
+         outputs=["provenance_output.crate", "provenance_output.crate.zip"],
+         clean=["provenance_output.crate", "provenance_output.crate.zip"],
+         label="📦 Converting to Provenance Run Crate"),
+    Step("workflow_preview", [
+            "cwltool --print-dot provenance_output.crate/packed.cwl | dot -Tpng -o workflow_preview.png",
+            "cp workflow_preview.png provenance_output.crate/workflow_preview.png",
+         ],
+         inputs=["provenance_output.crate/packed.cwl"],
+         outputs=["workflow_preview.png", "provenance_output.crate/workflow_preview.png"],
+         label="🖼️ Generating CWL workflow diagram"),
+    # Gates the Zenodo upload; the other crates are validated before the git publish
+    Step("validate_provenance", "python scripts/validate_metadata.py --crates provenance_output.crate",
+         inputs=["scripts/validate_metadata.py", "provenance_output.crate"],
+         after=["workflow_preview"],
+         label="🔎 Validating the provenance crate"),
+    Step("zenodo_upload", "python zenodo_upload.py",
+         inputs=["zenodo_upload.py", "*.tif", "workflow_preview.png", "provenance_output.crate.zip"],
+         after=["validate_provenance"],
+         label="☁️ Uploading new version to Zenodo"),
+    Step("provenance_preview", "python crate_preview.py provenance_output.crate",
+         inputs=["crate_preview.py", "provenance_output.crate/ro-crate-metadata.json"],
+         outputs=["provenance_output.crate/ro-crate-preview.html"],
+         label="🌐 Generating HTML preview of the provenance crate"),
+    Step("interface_crate", "python interface_crate.py",
+         inputs=["interface_crate.py", "Dockerfile", "Workflow_inputs/GNDVI_10m.yaml", "provenance_output.crate",
+                 "change_detection/change_summary.json"],
+         outputs=["interface.crate", "interface.crate.zip"],
+         label="🧬 Generating Interface Crate"),
+    Step("publication_context", "python publication_context.py",
+         inputs=["publication_context.py", "provenance_index.py", "s2_metadata.py", "interface.crate/ro-crate-metadata.json"],
+         outputs=[".cache/publication_context.json"],
+         label="🗂️ Building publication context"),
+    Step("interface_preview", "python crate_preview.py interface.crate",
+         inputs=["crate_preview.py", "interface.crate/ro-crate-metadata.json"],
+         outputs=["interface.crate/ro-crate-preview.html"],
+         label="🌐 Generating HTML preview of the interface crate"),
+    Step("dnf_document", "stencila convert dynamic_publication.smd DNF_Document.json",
+         inputs=["dynamic_publication.smd"],
+         outputs=["DNF_Document.json"],
+         label="📄 Generating DNF Document"),
+    Step("dnf_render", "stencila render DNF_Document.json DNF_Evaluated_Document.json --force-all --pretty",
+         inputs=["DNF_Document.json", ".cache/publication_context.json", "interface.crate/ro-crate-metadata.json",
+                 "provenance_output.crate/ro-crate-metadata.json"],
+         outputs=["DNF_Evaluated_Document.json"],
+         label="📑 Rendering DNF Document with interface.crate"),
+    Step("article_html", "stencila convert DNF_Evaluated_Document.json docs/publication/research_article.html --pretty",
+         inputs=["DNF_Evaluated_Document.json"],
+         outputs=["docs/publication/research_article.html"],
+         clean=["docs/publication/research_article.html", "docs/publication/research_article.html.images"],
+         label="📊 Creating HTML presentation of the rendered article"),
+    Step("article_md", "stencila convert DNF_Evaluated_Document.json docs/publication/research_article.md --pretty",
+         inputs=["DNF_Evaluated_Document.json"],
+         outputs=["docs/publication/research_article.md"],
+         label="📊 Creating Markdown presentation of the rendered article"),
+    Step("docs_workflow_preview", [
+            "mkdir -p docs/interface.crate/provenance_output.crate",
+            "cp workflow_preview.png docs/interface.crate/provenance_output.crate/workflow_preview.png",
+         ],
+         inputs=["workflow_preview.png"],
+         outputs=["docs/interface.crate/provenance_output.crate/workflow_preview.png"],
+         label="🖼️ Copying workflow diagram into the site"),
+    Step("publication_crate", "python publication_crate.py",
+         inputs=["publication_crate.py", "DNF_Document.json", "DNF_Evaluated_Document.json",
+                 "docs/publication/research_article.html", "docs/publication/research_article.md",
+                 "interface.crate/ro-crate-metadata.json"],
+         outputs=["publication.crate", "publication.crate.zip"],
+         label="📦 Generating the Publication Crate"),
+    Step("publication_preview", "python crate_preview.py publication.crate",
+         inputs=["crate_preview.py", "publication.crate/ro-crate-metadata.json"],
+         outputs=["publication.crate/ro-crate-preview.html"],
+         label="🌐 Generating HTML preview for the Publication Crate"),
+    Step("validate_crates",
+         "python scripts/validate_metadata.py --crates interface.crate publication.crate",
+         inputs=["scripts/validate_metadata.py", "interface.crate", "publication.crate"],
+         after=["interface_preview", "publication_preview"],
+         label="🔎 Validating the interface and publication crates"),
+    Step("site", "python docs/template_renderer.py",
+         inputs=["docs/template_renderer.py", "docs/templates",
+                 "provenance_output.crate/ro-crate-preview.html", "interface.crate/ro-crate-preview.html",
+                 "publication.crate/ro-crate-preview.html", "docs/publication/research_article.html"],
+         outputs=["docs/index.html", "docs/provenance.html", "docs/interface.html",
+                  "docs/publication.html", "docs/research_article.html"],
+         label="🧱 Generating templated HTML site"),
+    Step("publish", [
+            "git add .",
+            'git diff --cached --quiet || git commit -m "Automated publish: new CWL run, crate, and Zenodo version"',
+            "git push",
+         ],
+         after=["zenodo_upload", "site", "docs_workflow_preview", "publication_preview", "validate_crates"],
+         always=True,
+         label="📤 Committing and pushing to GitHub"),
+]
+
+
+def expand(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        paths.extend(sorted(matches))
+    return paths
+
+
+def overlaps(a, b):
+    # True when one path is the other or lies inside it
+    a, b = os.path.normpath(a), os.path.normpath(b)
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+def matches(path_pattern, output_pattern):
+    if glob.has_magic(output_pattern) or glob.has_magic(path_pattern):
+        return fnmatch.fnmatch(path_pattern, output_pattern) or fnmatch.fnmatch(output_pattern, path_pattern)
+    return overlaps(path_pattern, output_pattern)
+
+
+def build_graph(steps):
+    by_name = {step.name: step for step in steps}
+    deps = {}
+    for index, step in enumerate(steps):
+        # Producers are the earlier steps writing something this step reads
+        producers = {
+            other.name for other in steps[:index]
+            if any(matches(i, o) for i in step.inputs for o in other.outputs)
+        }
+        for name in step.after:
+            if name not in by_name:
+                raise Exception(f"Step {step.name} runs after unknown step {name}")
+            producers.add(name)
+        deps[step.name] = producers
+    return by_name, deps
+
+
+def select(targets, by_name, deps):
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in by_name:
+            raise Exception(f"Unknown target {name}; see --list")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return selected
+
+
+def fingerprint(step, hash_cache=None):
+    return build_manifest(expand(step.inputs), {"commands": step.commands}, hash_cache)
+
+
+def up_to_date(step, manifest):
+    if step.always:
+        return False
+    return is_up_to_date(f"pipeline-{step.name}", manifest, expand(step.outputs))
+
+
+def remove(patterns):
+    for path in expand(patterns):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+class Tracer:
+    # Collects Chrome trace events; each worker thread gets its own track
+    def __init__(self, path=TRACE_PATH, targets=()):
+        self.path = path
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.stages = {}
+        self.threads = {}
+        self.info = {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "targets": list(targets),
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        }
+
+    def now(self):
+        return time.perf_counter() - self.origin
+
+    def tid(self):
+        with self.lock:
+            return self.threads.setdefault(threading.get_ident(), len(self.threads) + 1)
+
+    def complete(self, name, category, start, end, args):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": 1,
+            "tid": self.tid(),
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def stage(self, name, summary):
+        with self.lock:
+            self.stages[name] = summary
+        self.write()
+
+    def write(self):
+        with self.lock:
+            threads = [
+                {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": f"worker {tid}"}}
+                for tid in self.threads.values()
+            ]
+            trace = {
+                "traceEvents": threads + list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": dict(self.info, stages=dict(self.stages)),
+            }
+        # Written after every stage, so steps that run later (interface_crate) see the run so far
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def run_command(command, tracer=None):
+    start = tracer.now() if tracer else 0.0
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, shell=True)
+    # wait4 reports the child's rusage, including the descendants it reaped
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    record = {
+        "command": command,
+        "returncode": proc.returncode,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "user_cpu_seconds": round(usage.ru_utime, 3),
+        "system_cpu_seconds": round(usage.ru_stime, 3),
+        # Kilobytes on Linux
+        "max_rss_kb": usage.ru_maxrss,
+        "read_bytes": usage.ru_inblock * BLOCK_SIZE,
+        "write_bytes": usage.ru_oublock * BLOCK_SIZE,
+    }
+    if tracer:
+        tracer.complete(command.split()[0], "command", start, tracer.now(), record)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+    return record
+
+
+def summarize(records):
+    return {
+        "user_cpu_seconds": round(sum(r["user_cpu_seconds"] for r in records), 3),
+        "system_cpu_seconds": round(sum(r["system_cpu_seconds"] for r in records), 3),
+        "max_rss_kb": max((r["max_rss_kb"] for r in records), default=0),
+        "read_bytes": sum(r["read_bytes"] for r in records),
+        "write_bytes": sum(r["write_bytes"] for r in records),
+        "commands": records,
+    }
+
+
+def run_step(step, force=False, dry_run=False, hash_cache=None, tracer=None):
+    started = time.perf_counter()
+    start = tracer.now() if tracer else 0.0
+    manifest = fingerprint(step, hash_cache)
+    fingerprint_seconds = round(tracer.now() - start, 3) if tracer else None
+    if not force and up_to_date(step, manifest):
+        print(f"⏭️  {step.name}: up to date")
+        if tracer:
+            summary = {"status": "skipped", "fingerprint_seconds": fingerprint_seconds}
+            tracer.complete(step.name, "step", start, tracer.now(), summary)
+            tracer.stage(step.name, summary)
+        return "skipped"
+    print(f"{step.label}...")
+    if dry_run:
+        return "would run"
+
+    remove(step.clean)
+    records = []
+    try:
+        for command in step.commands:
+            records.append(run_command(command, tracer))
+        status = "ran"
+    except subprocess.CalledProcessError:
+        status = "failed"
+        raise
+    finally:
+        if tracer:
+            end = tracer.now()
+            summary = dict(summarize(records), status=status,
+                           wall_seconds=round(end - start, 3), fingerprint_seconds=fingerprint_seconds)
+            tracer.complete(step.name, "step", start, end, {k: v for k, v in summary.items() if k != "commands"})
+            tracer.stage(step.name, summary)
+
+    # Outputs are whatever the commands left behind; fingerprint the inputs they saw
+    save_manifest(f"pipeline-{step.name}", manifest)
+    print(f"✔️  {step.name} finished in {time.perf_counter() - started:.1f}s")
+    return status
+
+
+def run_pipeline(targets, steps=STEPS, workers=DEFAULT_WORKERS, force=False, dry_run=False, trace_path=TRACE_PATH):
+    by_name, deps = build_graph(steps)
+    selected = select(targets, by_name, deps)
+    order = [step.name for step in steps if step.name in selected]
+    waiting = {name: set(deps[name]) & selected for name in order}
+    results = {}
+    # One cache shared by all worker threads
+    hash_cache = HashCache()
+    tracer = None if dry_run or not trace_path else Tracer(trace_path, targets)
+    if tracer:
+        tracer.write()
+
+    with ThreadPoolExecutor(max_workers=1 if dry_run else workers) as pool:
+        running = {}
+        while waiting or running:
+            # Submit everything whose dependencies have finished, in declaration order
+            for name in [n for n in order if n in waiting and not waiting[n]]:
+                del waiting[name]
+                running[pool.submit(run_step, by_name[name], force, dry_run, hash_cache, tracer)] = name
+            if not running:
+                raise Exception(f"Dependency cycle between steps: {', '.join(waiting)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # Let running steps finish, but start nothing new; report the
+                    # first failure, not whichever running step fails after it
+                    waiting.clear()
+                    wait(running)
+                    for other, other_name in running.items():
+                        if other.exception() is not None:
+                            print(f"❌ Step {other_name} also failed: {other.exception()}")
+                    raise Exception(f"Step {name} failed: {e}") from e
+                results[name] = outcome
+                for remaining in waiting.values():
+                    remaining.discard(name)
+    return results
+
+
+def clean_all():
+    print("🧹 Cleaning project directory...")
+    remove(CLEAN_PATHS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the LivePublication publish pipeline.")
+    parser.add_argument("targets", nargs="*", default=[DEFAULT_TARGET],
+                        help=f"Steps to bring up to date (default: {DEFAULT_TARGET})")
+    parser.add_argument("--clean", action="store_true", help="Delete every step output first (full rebuild)")
+    parser.add_argument("--force", action="store_true", help="Run the selected steps even if up to date")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="Show which steps would run")
+    parser.add_argument("--list", action="store_true", help="List the steps and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        _, deps = build_graph(STEPS)
+        for step in STEPS:
+            print(f"{step.name}: {', '.join(sorted(deps[step.name])) or '-'}")
+    else:
+        if args.clean and not args.dry_run:
+            clean_all()
+        run_pipeline(args.targets, workers=args.workers, force=args.force, dry_run=args.dry_run)
+        if args.dry_run:
+            print("✅ Dry run complete.")
+        elif DEFAULT_TARGET in args.targets:
+            print("✅ Done. Your pipeline has been published and pushed!")
+        else:
+            print("✅ Done.")
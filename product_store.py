@@ -0,0 +1,137 @@
+# product_store.py
+#
+# Persistent store of extracted Sentinel-2 products, keyed by product id and
+# the catalogue checksum of the product. Workflow_inputs/Data only holds
+# symlinks into the store, so cleaning the pipeline no longer forces a
+# re-download. The store is kept under a size budget with LRU eviction.
+
+import json
+import os
+import shutil
+import time
+
+STORE_ROOT = ".cache/products"
+INDEX_NAME = "index.json"
+DEFAULT_BUDGET_BYTES = int(float(os.environ.get("PRODUCT_STORE_BUDGET_GB", "20")) * 1024 ** 3)
+
+
+def product_checksum(product):
+    # Catalogue records carry one or more {"Algorithm", "Value"} checksums of the product zip
+    checksums = sorted(
+        f"{c['Algorithm']}:{c['Value']}" for c in product.get("Checksum", []) if c.get("Value")
+    )
+    return checksums[0] if checksums else None
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+
+class ProductStore:
+    def __init__(self, root=STORE_ROOT, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.index_path = os.path.join(root, INDEX_NAME)
+        os.makedirs(root, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def path_for(self, product_id):
+        return os.path.join(self.root, product_id)
+
+    def get(self, product_id, checksum, band_ids):
+        entry = self.index.get(product_id)
+        path = self.path_for(product_id)
+        if entry is None or not os.path.isdir(path):
+            return None
+        if checksum is not None and entry["checksum"] != checksum:
+            print(f"Stored copy of {product_id} is outdated (checksum changed)")
+            self.remove(product_id)
+            return None
+        if not set(band_ids) <= set(entry["bands"]):
+            return None
+        entry["last_used"] = time.time()
+        self._save_index()
+        print(f"Using stored product: {path}")
+        return path
+
+    # `populate(directory)` writes the product's members into a fresh staging directory
+    def put(self, product_id, checksum, band_ids, populate):
+        path = self.path_for(product_id)
+        staging = os.path.join(self.root, f".staging-{product_id}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            populate(staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # Keep any bands a previous fetch already stored for this product
+        previous = self.index.get(product_id)
+        bands = set(band_ids)
+        if previous and previous["checksum"] == checksum and os.path.isdir(path):
+            shutil.copytree(path, staging, dirs_exist_ok=True)
+            bands |= set(previous["bands"])
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+
+        self.index[product_id] = {
+            "checksum": checksum,
+            "bands": sorted(bands),
+            "size": directory_size(path),
+            "last_used": time.time(),
+        }
+        self.evict(keep=[product_id])
+        self._save_index()
+        return path
+
+    def remove(self, product_id):
+        shutil.rmtree(self.path_for(product_id), ignore_errors=True)
+        self.index.pop(product_id, None)
+        self._save_index()
+
+    def evict(self, keep=()):
+        total = sum(entry["size"] for entry in self.index.values())
+        by_age = sorted(self.index.items(), key=lambda item: item[1]["last_used"])
+        for product_id, entry in by_age:
+            if total <= self.budget_bytes:
+                break
+            if product_id in keep:
+                continue
+            print(f"Evicting {product_id} from product store ({entry['size']} bytes)")
+            shutil.rmtree(self.path_for(product_id), ignore_errors=True)
+            del self.index[product_id]
+            total -= entry["size"]
+        self._save_index()
+
+    # Expose a stored product under target_dir (e.g. Workflow_inputs/Data) as a symlink
+    def link(self, product_id, target_dir):
+        os.makedirs(target_dir, exist_ok=True)
+        link_path = os.path.join(target_dir, product_id)
+        if os.path.islink(link_path):
+            os.remove(link_path)
+        elif os.path.isdir(link_path):
+            shutil.rmtree(link_path)
+        # Relative, so the link does not embed this machine's checkout path
+        os.symlink(os.path.relpath(self.path_for(product_id), target_dir), link_path)
+        return link_path
+
+
+def resolve(path):
+    # Products in Workflow_inputs/Data are symlinks into the store
+    return os.path.realpath(path)
@@ -0,0 +1,100 @@
+# provenance_index.py
+#
+# Indexed access to RO-Crate graphs for dynamic_publication.smd. A crate is
+# loaded once and indexed by @id, by @type and by reverse reference, so the
+# per-step lookups the publication needs are dictionary hits rather than
+# scans over the whole graph.
+
+import json
+from collections import defaultdict
+from pathlib import Path
+
+WORKFLOW_TYPES = ["File", "SoftwareSourceCode", "ComputationalWorkflow", "HowTo"]
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def iter_references(value):
+    # Yield every {"@id": ...} reference nested in a property value
+    for item in as_list(value):
+        if isinstance(item, dict):
+            if "@id" in item:
+                yield item["@id"]
+            else:
+                for nested in item.values():
+                    yield from iter_references(nested)
+
+
+class CrateGraph:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.graph = metadata.get("@graph", [])
+        self.by_id = {}
+        self.position = {}
+        self.by_type = defaultdict(list)
+        self.referrers = defaultdict(list)
+
+        for index, entity in enumerate(self.graph):
+            entity_id = entity.get("@id")
+            self.by_id[entity_id] = entity
+            self.position[entity_id] = index
+            for type_name in as_list(entity.get("@type")):
+                self.by_type[type_name].append(entity)
+            for key, value in entity.items():
+                if key.startswith("@"):
+                    continue
+                for target in iter_references(value):
+                    self.referrers[target].append((entity_id, key))
+
+    @classmethod
+    def load(cls, path):
+        with Path(path).open() as f:
+            return cls(json.load(f))
+
+    def get(self, entity_id, default=None):
+        return self.by_id.get(entity_id, default)
+
+    def resolve(self, reference):
+        if isinstance(reference, dict):
+            return self.by_id.get(reference.get("@id"))
+        return None
+
+    def resolve_all(self, references):
+        # Resolved entities in graph order, matching the order of a full graph scan
+        resolved = [self.resolve(ref) for ref in as_list(references)]
+        return sorted((e for e in resolved if e is not None), key=lambda e: self.position[e["@id"]])
+
+    def of_type(self, type_name):
+        return list(self.by_type.get(type_name, []))
+
+    def referenced_by(self, entity_id, prop=None):
+        return [
+            self.by_id[source] for source, key in self.referrers.get(entity_id, [])
+            if prop is None or key == prop
+        ]
+
+    def workflow(self):
+        return next((e for e in self.graph if e.get("@type") == WORKFLOW_TYPES), None)
+
+    def steps(self):
+        return sorted(self.of_type("ControlAction"), key=lambda x: x.get("position", 0))
+
+    def step_summaries(self, format_time=None):
+        summaries = []
+        for step in self.steps():
+            create_action = dict(self.resolve(step.get("object")))
+            if format_time is not None:
+                create_action["startTime"] = format_time(create_action["startTime"])
+                create_action["endTime"] = format_time(create_action["endTime"])
+            summaries.append({
+                "CreateAction": create_action,
+                "SoftwareApplication": self.resolve(create_action.get("instrument")),
+                "ContainerImage": self.resolve(create_action.get("containerImage")),
+                "Inputs": self.resolve_all(create_action.get("object")),
+                "Outputs": self.resolve_all(create_action.get("result")),
+            })
+        return summaries
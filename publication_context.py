@@ -0,0 +1,187 @@
+# publication_context.py
+#
+# Precompute everything dynamic_publication.smd needs from interface.crate
+# (E1 product/platform/quality metadata, workflow parameters and step
+# summaries, image paths, E2.1/E3 references) into one compact JSON file.
+# The context is keyed by a hash of the crate metadata, so the document's
+# chunks load a single small file on every render and only rebuild it when
+# the crate has changed. Run right after interface_crate.py.
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from provenance_index import CrateGraph
+from s2_metadata import extract_sections
+
+CRATE_DIR = Path("interface.crate")
+CONTEXT_PATH = Path(".cache/publication_context.json")
+# Bump when the shape of the context changes
+CONTEXT_VERSION = 2
+
+
+# A quick helper to create readable dates
+def parse_iso8601(dt_str):
+    try:
+        # Remove 'Z' if present and parse
+        dt_str = dt_str.rstrip("Z")
+        dt = datetime.fromisoformat(dt_str)
+        # Format as "YYYY-MM-DD HH:MM:SS"
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return dt_str  # fallback to original if parsing fails
+
+
+def provenance_crate_path(interface_index):
+    e22_wms = interface_index.get("#E2.2-wms", {})
+    return e22_wms.get("hasPart", [{}])[0].get("@id", None)
+
+
+def crate_hash(crate_dir=CRATE_DIR):
+    # The context depends on the interface metadata and the nested provenance
+    # metadata; hash their raw bytes so a cache hit never parses the crate
+    digest = hashlib.sha256(str(CONTEXT_VERSION).encode())
+    digest.update((crate_dir / "ro-crate-metadata.json").read_bytes())
+    for nested_metadata in sorted(crate_dir.glob("*/ro-crate-metadata.json")):
+        digest.update(nested_metadata.parent.name.encode())
+        digest.update(nested_metadata.read_bytes())
+    return digest.hexdigest()
+
+
+# Load metadata for E1: Data Producer Output
+def e1_context(interface_index, crate_dir=CRATE_DIR):
+    e1_data = interface_index.get("#E1-data-producer", {})
+    e1_file_ids = [f["@id"] for f in e1_data.get("hasPart", []) if "@id" in f]
+
+    # Representative image
+    e1_thumbnail_id = next((f for f in e1_file_ids if f.endswith("-ql.jpg")), None)
+    context = {
+        "e1_thumbnail": f"{crate_dir.as_posix()}/{e1_thumbnail_id}" if e1_thumbnail_id else None,
+        "e1_product_info_human": {},
+        "e1_platform_info_human": {},
+        "e1_image_quality": {},
+    }
+
+    mtd_id = next((fid for fid in e1_file_ids if fid.endswith("MTD_MSIL2A.xml")), None)
+    mtd_path = crate_dir / mtd_id if mtd_id else None
+    if mtd_path is None or not mtd_path.exists():
+        return context
+
+    sections = extract_sections(mtd_path, ("Product_Info", "Datatake", "Image_Content_QI"))
+    e1_product_info = dict(sections["Product_Info"])
+    e1_platform_info = dict(sections["Datatake"])
+    e1_image_quality = dict(sections["Image_Content_QI"])
+
+    # Round all float values in e1_image_quality to two decimal places (if possible)
+    for k, v in e1_image_quality.items():
+        try:
+            e1_image_quality[k] = round(float(v), 2)
+        except (ValueError, TypeError):
+            pass
+
+    e1_product_info_human = dict(e1_product_info)
+    for key in ["PRODUCT_START_TIME", "PRODUCT_STOP_TIME", "GENERATION_TIME"]:
+        if key in e1_product_info_human:
+            e1_product_info_human[key + "_HUMAN"] = parse_iso8601(e1_product_info_human[key])
+
+    e1_platform_info_human = dict(e1_platform_info)
+    for k in list(e1_platform_info_human.keys()):
+        e1_platform_info_human[k + "_HUMAN"] = parse_iso8601(e1_platform_info_human[k])
+
+    context.update({
+        "e1_product_info_human": e1_product_info_human,
+        "e1_platform_info_human": e1_platform_info_human,
+        "e1_image_quality": e1_image_quality,
+    })
+    return context
+
+
+# Load metadata for E2.1: Workflow Infrastructure
+def e2_1_context(interface_index, crate_dir=CRATE_DIR):
+    e2_1_parts = interface_index.get("#E2.1-workflow-infrastructure", {}).get("hasPart", [])
+    e2_1_dockerfile = next((f["@id"] for f in e2_1_parts if f["@id"] == "Dockerfile"), None)
+
+    e2_1_dockerfile_content = None
+    if e2_1_dockerfile and (crate_dir / e2_1_dockerfile).exists():
+        e2_1_dockerfile_content = (crate_dir / e2_1_dockerfile).read_text()
+
+    return {
+        "e2_1_dockerfile": e2_1_dockerfile,
+        "e2_1_dockerfile_content": e2_1_dockerfile_content,
+        "e2_1_container_url": next((f["@id"] for f in e2_1_parts if "docker.com" in f["@id"]), None),
+    }
+
+
+# Workflow parameters and step summaries from the nested provenance crate
+def e2_2_context(interface_index, crate_dir=CRATE_DIR):
+    nested = provenance_crate_path(interface_index)
+    provenance_index = CrateGraph({"@graph": []})
+    if nested:
+        provenance_manifest = crate_dir / nested / "ro-crate-metadata.json"
+        if provenance_manifest.exists():
+            provenance_index = CrateGraph.load(provenance_manifest)
+
+    return {
+        "provenance_crate_path": nested,
+        "workflow": provenance_index.workflow(),
+        "FormalParameters": provenance_index.of_type("FormalParameter"),
+        "step_summaries": provenance_index.step_summaries(format_time=parse_iso8601),
+    }
+
+
+# Change statistics against the previous scene, when E3 carries them
+def e3_change_context(e3_dataset, crate_dir=CRATE_DIR):
+    summary_id = next((f["@id"] for f in e3_dataset.get("hasPart", []) if f["@id"].endswith("change_summary.json")), None)
+    change_summary = None
+    if summary_id and (crate_dir / summary_id).exists():
+        change_summary = json.loads((crate_dir / summary_id).read_text())
+        # The histogram is only needed by readers of the file itself
+        change_summary.pop("histogram", None)
+    return {"change_summary": change_summary}
+
+
+def first_file_with_suffix(directory, suffix):
+    if not directory.exists():
+        return None
+    return next((str(f) for f in sorted(directory.iterdir()) if f.suffix.lower() == suffix), None)
+
+
+def build_context(crate_dir=CRATE_DIR):
+    interface_index = CrateGraph.load(crate_dir / "ro-crate-metadata.json")
+    e3_dataset = interface_index.get("#E3-experimental-results", {})
+
+    context = {}
+    context.update(e1_context(interface_index, crate_dir))
+    context.update(e2_1_context(interface_index, crate_dir))
+    context.update(e2_2_context(interface_index, crate_dir))
+    context.update(e3_change_context(e3_dataset, crate_dir))
+    context.update({
+        "zenodo_entry": e3_dataset.get("hasPart", [{}])[0].get("@id", None),
+        "png_path": first_file_with_suffix(crate_dir / "provenance_output.crate", ".png"),
+        "jpg_path": first_file_with_suffix(crate_dir, ".jpg"),
+    })
+    return context
+
+
+def write_context(crate_dir=CRATE_DIR, context_path=CONTEXT_PATH):
+    context = {"crate_hash": crate_hash(crate_dir), "context": build_context(crate_dir)}
+    context_path.parent.mkdir(parents=True, exist_ok=True)
+    with context_path.open("w", encoding="utf-8") as f:
+        json.dump(context, f, separators=(",", ":"))
+    print(f"Publication context written to {context_path}")
+    return context["context"]
+
+
+# Used by the document: the cached context if it matches the crate, else a fresh build
+def load_context(crate_dir=CRATE_DIR, context_path=CONTEXT_PATH):
+    if context_path.exists():
+        with context_path.open(encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("crate_hash") == crate_hash(crate_dir):
+            return cached["context"]
+    return write_context(crate_dir, context_path)
+
+
+if __name__ == "__main__":
+    write_context()
@@ -5,6 +5,9 @@ import shutil
 import re
 import subprocess
 
+from crate_packaging import write_crate
+from crate_manifest import build_manifest, is_up_to_date, save_manifest
+
 
 # Helper functions for DNF contextual entities
 def add_dnf_evaluated_document(crate):
@@ -144,23 +147,40 @@ def create_publication_crate(crate_name: str):
     research_article["wasGeneratedBy"] = dnf_presentation_env
     dnf_document["conformsTo"] = dnf_engine_schema
 
-    crate.write(crate_name)
-
-    print(f"RO-Crate written to {crate_name}")
-
-    import zipfile
+    # The nested interface crate is a directory dataset, streamed from its source tree
+    write_crate(
+        crate, f"{crate_name}.zip", unpacked_dir=crate_name,
+        extra_trees={"interface.crate": "interface.crate"},
+    )
+
+    nested_metadata = os.path.join(crate_name, "interface.crate", "ro-crate-metadata.json")
+    if not os.path.isfile(nested_metadata):
+        raise Exception(f"Nested interface crate is missing from {crate_name}: {nested_metadata} not found.")
+
+# Input files and generator parameters that determine the publication crate
+def publication_crate_manifest():
+    inputs = [
+        __file__,
+        "DNF_Document.json",
+        "DNF_Evaluated_Document.json",
+        "docs/publication/research_article.html",
+        "docs/publication/research_article.md",
+        "interface.crate",
+    ]
+    try:
+        stencila_version = subprocess.check_output(["stencila", "--version"], text=True).strip()
+    except Exception:
+        stencila_version = "unknown"
+    return build_manifest(inputs, {"stencila": stencila_version})
 
-    zip_path = f"{crate_name}.zip"
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(crate_name):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, crate_name)
-                zipf.write(file_path, arcname)
-    print(f"RO-Crate zipped to {zip_path}")
 
 if __name__ == "__main__":
     crate_name = "publication.crate"
-    if os.path.exists(crate_name):
-      shutil.rmtree(crate_name)
-    create_publication_crate(crate_name)
\ No newline at end of file
+    manifest = publication_crate_manifest()
+    if is_up_to_date(crate_name, manifest, [crate_name, f"{crate_name}.zip"]):
+      print(f"{crate_name} is up to date; skipping rebuild")
+    else:
+      if os.path.exists(crate_name):
+        shutil.rmtree(crate_name)
+      create_publication_crate(crate_name)
+      save_manifest(crate_name, manifest)
\ No newline at end of file
@@ -0,0 +1,141 @@
+# s2_metadata.py
+#
+# Streaming extraction of Sentinel-2 product metadata. MTD_MSIL2A.xml
+# sections and the manifest.safe inventory are read with iterparse in one
+# forward pass, elements are cleared as soon as they are consumed, and
+# parsing stops once every requested section has been seen. Sources can be
+# plain files or members still inside a SAFE zip (local, or remote through
+# safe_extract.open_remote_zip). Results are memoized per content hash.
+
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+import zipfile
+
+CACHE_DIR = ".cache/s2_metadata"
+DEFAULT_SECTIONS = ("Product_Info", "Datatake", "Image_Content_QI")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_memo = {}
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def find_member(zip_ref, name):
+    # Members sit below "<id>.SAFE/" in product zips
+    for member in zip_ref.namelist():
+        if member == name or member.endswith("/" + name):
+            return member
+    raise FileNotFoundError(f"{name} not found in archive")
+
+
+def source_key(source, member=None):
+    # Zip members are keyed by their stored CRC and size, so nothing is read
+    if member is not None:
+        with zipfile.ZipFile(source) as zip_ref:
+            info = zip_ref.getinfo(find_member(zip_ref, member))
+        return f"zip-{info.CRC:08x}-{info.file_size}"
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_source(source, member=None):
+    if member is None:
+        return open(source, "rb"), None
+    zip_ref = zipfile.ZipFile(source)
+    return zip_ref.open(find_member(zip_ref, member)), zip_ref
+
+
+def memoized(kind, source, member, parse):
+    key = f"{kind}-{source_key(source, member)}"
+    if key in _memo:
+        return _memo[key]
+    cache_path = os.path.join(CACHE_DIR, f"{key}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            _memo[key] = json.load(f)
+        return _memo[key]
+
+    handle, zip_ref = open_source(source, member)
+    try:
+        result = parse(handle)
+    finally:
+        handle.close()
+        if zip_ref is not None:
+            zip_ref.close()
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    _memo[key] = result
+    return result
+
+
+def parse_sections(handle, sections):
+    wanted = set(sections)
+    found = {}
+    # Open wanted sections (they may nest, e.g. Datatake inside Product_Info) -> depth
+    active = {}
+    depth = 0
+    for event, elem in ET.iterparse(handle, events=("start", "end")):
+        name = local_name(elem.tag)
+        if event == "start":
+            depth += 1
+            if name in wanted and name not in found:
+                active[name] = depth
+                found[name] = {}
+            continue
+
+        # Direct children of an open section carry its key/value pairs
+        if elem.text is not None and elem.text.strip():
+            for section, section_depth in active.items():
+                if depth == section_depth + 1:
+                    found[section][name] = elem.text
+        if active.get(name) == depth:
+            del active[name]
+            if not active and len(found) == len(wanted):
+                break
+        # Everything below this element has been consumed
+        elem.clear()
+        depth -= 1
+    return {section: found.get(section, {}) for section in sections}
+
+
+# e.g. extract_sections("MTD_MSIL2A.xml") or extract_sections("product.zip", member="MTD_MSIL2A.xml")
+def extract_sections(source, sections=DEFAULT_SECTIONS, member=None):
+    sections = tuple(sections)
+    kind = "sections-" + hashlib.sha1(",".join(sections).encode()).hexdigest()[:8]
+    return memoized(kind, source, member, lambda handle: parse_sections(handle, sections))
+
+
+def parse_inventory(handle):
+    inventory = []
+    for _, elem in ET.iterparse(handle, events=("end",)):
+        if local_name(elem.tag) != "dataObject":
+            continue
+        entry = {"id": elem.get("ID")}
+        for child in elem.iter():
+            name = local_name(child.tag)
+            if name == "byteStream":
+                entry["size"] = int(child.get("size", 0))
+                entry["mimeType"] = child.get("mimeType")
+            elif name == "fileLocation":
+                href = child.get("href", "")
+                entry["href"] = href[2:] if href.startswith("./") else href
+            elif name == "checksum":
+                entry["checksumName"] = child.get("checksumName")
+                entry["checksum"] = (child.text or "").strip()
+        inventory.append(entry)
+        elem.clear()
+    return inventory
+
+
+# Every data object listed in manifest.safe with its size and checksum
+def manifest_inventory(source, member=None):
+    return memoized("inventory", source, member, parse_inventory)
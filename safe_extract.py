@@ -0,0 +1,138 @@
+# safe_extract.py
+#
+# Manifest-driven extraction of the few members we actually use from a
+# Sentinel-2 SAFE product zip. Works on a local zip or, via HTTP range
+# requests, directly on the remote archive without downloading it.
+
+import fnmatch
+import io
+import os
+import shutil
+import zipfile
+
+# Files at the root of the SAFE directory needed by encode_e1_data_producer
+SAFE_METADATA_FILES = ["INSPIRE.xml", "manifest.safe", "MTD_MSIL2A.xml"]
+SAFE_IMAGE_PATTERNS = ["*.jpg"]
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class RangeRequestsUnsupported(Exception):
+    pass
+
+
+def strip_safe_prefix(name):
+    # Products are zipped as "<id>.SAFE/...": drop that leading directory so
+    # members land directly in the flattened product directory.
+    parts = name.split("/", 1)
+    if len(parts) == 2 and parts[0].endswith(".SAFE"):
+        return parts[1]
+    return name
+
+
+def build_manifest(member_names, band_ids=("B03", "B08"), resolution="R10m"):
+    suffix = resolution.lstrip("R")
+    band_patterns = [
+        f"GRANULE/*/IMG_DATA/{resolution}/*_{band}_{suffix}.jp2" for band in band_ids
+    ]
+    root_patterns = SAFE_METADATA_FILES + SAFE_IMAGE_PATTERNS
+
+    manifest = {}
+    for name in member_names:
+        if name.endswith("/"):
+            continue
+        relative = strip_safe_prefix(name)
+        is_root_file = "/" not in relative
+        if is_root_file and any(fnmatch.fnmatch(relative, p) for p in root_patterns):
+            manifest[name] = relative
+        elif any(fnmatch.fnmatch(relative, p) for p in band_patterns):
+            manifest[name] = relative
+
+    # Every requested band and metadata file must be present in the archive
+    selected = list(manifest.values())
+    for band in band_ids:
+        if not any(f"_{band}_{suffix}.jp2" in path for path in selected):
+            raise FileNotFoundError(f"Could not find {band} band file in archive")
+    for file_name in SAFE_METADATA_FILES:
+        if file_name not in selected:
+            raise FileNotFoundError(f"Expected file {file_name} not found in archive")
+
+    return manifest
+
+
+def extract_safe_members(zip_source, target_dir, band_ids=("B03", "B08"), resolution="R10m"):
+    # zip_source may be a path or any seekable binary file object
+    os.makedirs(target_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_source, "r") as zip_ref:
+        manifest = build_manifest(zip_ref.namelist(), band_ids, resolution)
+        for member, relative in manifest.items():
+            destination = os.path.join(target_dir, *relative.split("/"))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with zip_ref.open(member) as src, open(destination, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            print(f"Extracted {relative}")
+    return manifest
+
+
+class HTTPRangeReader(io.RawIOBase):
+    # Read-only, seekable view of a remote file backed by HTTP range requests.
+    # `session` is anything with a requests-style get(), e.g. a CopernicusClient.
+
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+        self.position = 0
+
+        response = session.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+        response.close()
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code != 206 or "/" not in content_range:
+            raise RangeRequestsUnsupported(f"Server does not support range requests for {url}")
+        # Follow redirects once and then talk to the final location directly
+        self.url = response.url
+        self.size = int(content_range.rsplit("/", 1)[1])
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or len(buffer) == 0:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.session.get(self.url, headers={"Range": f"bytes={self.position}-{end}"})
+        response.raise_for_status()
+        data = response.content
+        # A 200 carries the whole file rather than the requested range
+        if response.status_code != 206 or len(data) > len(buffer):
+            raise RangeRequestsUnsupported(
+                f"Expected bytes {self.position}-{end} of {self.url}, got status {response.status_code} with {len(data)} bytes"
+            )
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_remote_zip(url, session, buffer_size=COPY_BUFFER_SIZE):
+    return io.BufferedReader(HTTPRangeReader(url, session), buffer_size=buffer_size)
+
+
+def fetch_safe_members(url, session, target_dir, band_ids=("B03", "B08"), resolution="R10m"):
+    with open_remote_zip(url, session) as remote:
+        return extract_safe_members(remote, target_dir, band_ids, resolution)
@@ -0,0 +1,107 @@
+# scene_selection.py
+#
+# Rank candidate STAC items by metadata quality before anything is downloaded.
+# All scoring is done on arrays covering the whole candidate set.
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from stac_catalog import item_cloud_cover
+
+# Relative weight of each quality term in the final score
+DEFAULT_WEIGHTS = {
+    "cloud": 0.45,
+    "nodata": 0.25,
+    "overlap": 0.2,
+    "recency": 0.1,
+}
+MAX_CLOUD_COVER = 60.0
+MAX_NODATA_FRACTION = 0.5
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+NODATA_PROPERTIES = ("s2:nodata_pixel_percentage", "nodataPixelPercentage")
+
+
+def polygon_area(coordinates):
+    # Shoelace area of the outer ring of a GeoJSON polygon, in degrees squared
+    ring = np.asarray(coordinates[0], dtype="f8")
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def footprint_area(geometry):
+    if not geometry:
+        return np.nan
+    if geometry.get("type") == "Polygon":
+        return polygon_area(geometry["coordinates"])
+    if geometry.get("type") == "MultiPolygon":
+        return sum(polygon_area(polygon) for polygon in geometry["coordinates"])
+    return np.nan
+
+
+def nodata_fraction(item, bbox_area):
+    properties = item.get("properties", {})
+    for key in NODATA_PROPERTIES:
+        if properties.get(key) is not None:
+            return float(properties[key]) / 100.0
+    # No reported value: approximate from how much of its bbox the footprint fills
+    # (partial-swath tiles have small, triangular footprints)
+    area = footprint_area(item.get("geometry"))
+    if np.isnan(area) or bbox_area <= 0:
+        return np.nan
+    return 1.0 - min(area / bbox_area, 1.0)
+
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return np.nan
+
+
+def candidate_arrays(items):
+    bounds = np.array([item.get("bbox") or [np.nan] * 4 for item in items], dtype="f8")[:, :4]
+    bbox_areas = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1])
+    cloud = np.array([item_cloud_cover(item) for item in items], dtype="f8")
+    nodata = np.array([nodata_fraction(item, area) for item, area in zip(items, bbox_areas)], dtype="f8")
+    timestamps = np.array([parse_datetime(item.get("properties", {}).get("datetime")) for item in items], dtype="f8")
+    return bounds, bbox_areas, cloud, nodata, timestamps
+
+
+def score_items(items, aoi_bbox, weights=DEFAULT_WEIGHTS, now=None):
+    if not items:
+        return np.empty(0)
+    aoi = np.array([float(v) for v in aoi_bbox.split(",")], dtype="f8")
+    now = (now or datetime.now(timezone.utc)).timestamp()
+    bounds, bbox_areas, cloud, nodata, timestamps = candidate_arrays(items)
+
+    # Fraction of each scene's bbox that falls inside the area of interest
+    width = np.clip(np.minimum(bounds[:, 2], aoi[2]) - np.maximum(bounds[:, 0], aoi[0]), 0, None)
+    height = np.clip(np.minimum(bounds[:, 3], aoi[3]) - np.maximum(bounds[:, 1], aoi[1]), 0, None)
+    overlap = np.where(bbox_areas > 0, width * height / bbox_areas, 0.0)
+
+    age_days = (now - timestamps) / 86400.0
+    recency = np.exp2(-np.clip(age_days, 0, None) / RECENCY_HALF_LIFE_DAYS)
+
+    # Unknown values get the worst still-acceptable score rather than exclusion
+    cloud = np.nan_to_num(cloud, nan=MAX_CLOUD_COVER)
+    nodata = np.nan_to_num(nodata, nan=MAX_NODATA_FRACTION)
+    recency = np.nan_to_num(recency, nan=0.0)
+
+    score = (
+        weights["cloud"] * (1.0 - cloud / 100.0)
+        + weights["nodata"] * (1.0 - nodata)
+        + weights["overlap"] * overlap
+        + weights["recency"] * recency
+    )
+    unusable = (cloud > MAX_CLOUD_COVER) | (nodata > MAX_NODATA_FRACTION) | (overlap <= 0)
+    return np.where(unusable, -np.inf, score)
+
+
+def select_best_items(items, aoi_bbox, n=1, weights=DEFAULT_WEIGHTS):
+    scores = score_items(items, aoi_bbox, weights)
+    order = [i for i in np.argsort(-scores, kind="stable")[:n] if np.isfinite(scores[i])]
+    for i in order:
+        print(f"Candidate {items[i]['id']}: score {scores[i]:.3f}")
+    return [items[i] for i in order]
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
+from datetime import datetime, timezone
 from pathlib import Path
-import shutil
+import json
+import os
+import sys
 
 from rocrate.rocrate import ROCrate
 from rocrate.model.contextentity import ContextEntity
 
+# crate_manifest lives at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from crate_manifest import HashCache
+
 TITLE = "LivePublication example application (Chapter 4)"
 DESCRIPTION = (
     "Example application for Chapter 4 of the LivePublication Framework thesis, "
@@ -18,20 +25,38 @@ REPO_URL = "https://github.com/GusEllerm/LivePublication-Example-Chapter-4"
 ORCID_URL = "https://orcid.org/0000-0001-8260-231X"
 
 
-def add_if_exists(crate, path_str):
-    path = Path(path_str)
-    if not path.exists():
-        return None
-    dest_path = f"./{path.as_posix()}"
-    return crate.add_file(
-        str(path),
-        dest_path=dest_path,
-        properties={"name": path.as_posix()},
-    )
+METADATA_PATH = "ro-crate-metadata.json"
+
+
+def file_properties(path, sha256):
+    stat = path.stat()
+    return {
+        "name": path.as_posix(),
+        "contentSize": str(stat.st_size),
+        "dateModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(timespec="seconds"),
+        "sha256": sha256,
+    }
+
+
+def add_key_files(crate, key_paths):
+    paths = [Path(p) for p in key_paths if Path(p).exists()]
+    # Hashed in parallel; the cache (keyed by path, size and mtime) skips unchanged files
+    hash_cache = HashCache()
+    digests = hash_cache.digest_many([str(path) for path in paths])
+    hash_cache.save()
+    return [
+        crate.add_file(
+            str(path),
+            dest_path=f"./{path.as_posix()}",
+            properties=file_properties(path, digests[str(path)]),
+        )
+        for path in paths
+    ]
 
 
 def main():
-    crate = ROCrate()
+    # Pinned so the output does not follow the ro-crate-py default (validate_metadata.py expects 1.1)
+    crate = ROCrate(version="1.1")
 
     person = crate.add(
         ContextEntity(
@@ -97,21 +122,17 @@ def main():
         "Makefile",
     ]
 
-    parts = [part for part in (add_if_exists(crate, p) for p in key_paths) if part]
+    parts = add_key_files(crate, key_paths)
     if parts:
         root["hasPart"] = parts
 
-    temp_dir = Path(".ro-crate-temp")
-    if temp_dir.exists():
-        shutil.rmtree(temp_dir)
-    crate.write(temp_dir)
-
-    metadata_path = temp_dir / "ro-crate-metadata.json"
-    if not metadata_path.exists():
-        raise FileNotFoundError("RO-Crate metadata was not generated as expected.")
-    shutil.copy2(metadata_path, Path("ro-crate-metadata.json"))
-    shutil.rmtree(temp_dir)
-    print("RO-Crate metadata written to ro-crate-metadata.json")
+    # Only the metadata is needed: the data entities are the repository files themselves,
+    # so the crate is not written out (which would copy every file)
+    tmp_path = f"{METADATA_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(crate.metadata.generate(), f, indent=4, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, METADATA_PATH)
+    print(f"RO-Crate metadata written to {METADATA_PATH}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
 import json
+import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import unquote
 
 import yaml
 
@@ -22,6 +28,14 @@ REQUIRED_FILES = [
     "scripts/validate_metadata.py",
 ]
 
+# Generated crates checked by --crates (nested crates inside them are checked too)
+GENERATED_CRATES = ["provenance_output.crate", "interface.crate", "publication.crate"]
+CRATE_METADATA = "ro-crate-metadata.json"
+CHECKSUM_PROPERTIES = {"sha256": hashlib.sha256, "sha1": hashlib.sha1, "md5": hashlib.md5}
+HASH_CHUNK_SIZE = 1024 * 1024
+# Absolute IRIs (http:, https:, urn:, mailto:, ...) point outside the crate
+ABSOLUTE_IRI = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*:")
+
 
 def load_json(path):
     with open(path, "r", encoding="utf-8") as handle:
@@ -46,19 +60,161 @@ def check_no_ellipsis(label, text, errors):
         errors.append(f"{label} contains ellipsis")
 
 
-def main():
-    errors = []
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def iter_references(value):
+    # Every {"@id": ...} reference nested in a property value
+    for item in as_list(value):
+        if isinstance(item, dict):
+            if "@id" in item:
+                yield item["@id"]
+            for key, nested in item.items():
+                if not key.startswith("@"):
+                    yield from iter_references(nested)
 
-    for path in REQUIRED_FILES:
-        if not Path(path).exists():
-            errors.append(f"Missing required file: {path}")
 
+def local_path(crate_dir, entity_id):
+    # Data entity ids are relative URI paths; "./" is the crate root
+    if ABSOLUTE_IRI.match(entity_id) or entity_id.startswith("#") or entity_id.startswith("_:"):
+        return None
+    return os.path.join(crate_dir, unquote(entity_id.split("#", 1)[0]))
+
+
+def file_checksum(path, algorithm):
+    digest = CHECKSUM_PROPERTIES[algorithm]()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_file(crate_dir, entity):
+    # Size and checksum checks for one File data entity
+    errors = []
+    path = local_path(crate_dir, entity["@id"])
+    size = str(entity.get("contentSize", ""))
+    if size.isdigit() and int(size) != os.path.getsize(path):
+        errors.append(f"{crate_dir}: {entity['@id']} is {os.path.getsize(path)} bytes, contentSize says {size}")
+    for algorithm in CHECKSUM_PROPERTIES:
+        expected = entity.get(algorithm)
+        if isinstance(expected, str) and file_checksum(path, algorithm) != expected.lower():
+            errors.append(f"{crate_dir}: {entity['@id']} does not match its {algorithm}")
+    return errors
+
+
+def index_crate(crate_dir):
+    # One pass over the graph to index it, one over the references to resolve
+    # them: O(entities + references). Returns errors, the File entities whose
+    # size/checksum still need checking and the nested crate directories.
+    metadata_path = os.path.join(crate_dir, CRATE_METADATA)
+    if not os.path.isfile(metadata_path):
+        return [f"{crate_dir}: missing {CRATE_METADATA}"], [], []
+    try:
+        metadata = load_json(metadata_path)
+    except json.JSONDecodeError as e:
+        return [f"{metadata_path}: invalid JSON ({e})"], [], []
+
+    errors = []
+    by_id = {}
+    for entity in metadata.get("@graph", []):
+        entity_id = entity.get("@id")
+        if entity_id is None:
+            errors.append(f"{crate_dir}: entity without @id ({entity.get('name') or entity.get('@type')})")
+        elif entity_id in by_id:
+            errors.append(f"{crate_dir}: duplicate @id {entity_id}")
+        else:
+            by_id[entity_id] = entity
+
+    for entity_id, entity in by_id.items():
+        for key, value in entity.items():
+            if key.startswith("@"):
+                continue
+            for target in iter_references(value):
+                if target not in by_id and not ABSOLUTE_IRI.match(target):
+                    errors.append(f"{crate_dir}: {entity_id} {key} -> {target} does not resolve")
+
+    descriptor = by_id.get(CRATE_METADATA)
+    root_id = (descriptor or {}).get("about", {}).get("@id")
+    if descriptor is None:
+        errors.append(f"{crate_dir}: no {CRATE_METADATA} descriptor entity")
+    elif root_id not in by_id:
+        errors.append(f"{crate_dir}: root data entity {root_id} is missing")
+
+    files = []
+    nested = []
+    for entity_id, entity in by_id.items():
+        types = as_list(entity.get("@type"))
+        path = local_path(crate_dir, entity_id)
+        if path is None or entity_id == CRATE_METADATA:
+            continue
+        if "File" in types:
+            if not os.path.isfile(path):
+                errors.append(f"{crate_dir}: data entity {entity_id} has no file")
+            else:
+                files.append(entity)
+        elif "Dataset" in types:
+            if not os.path.isdir(path):
+                errors.append(f"{crate_dir}: data entity {entity_id} has no directory")
+            elif entity_id != root_id and ("RO-Crate" in types or os.path.isfile(os.path.join(path, CRATE_METADATA))):
+                if not os.path.isfile(os.path.join(path, CRATE_METADATA)):
+                    errors.append(f"{crate_dir}: nested crate {entity_id} has no {CRATE_METADATA}")
+                else:
+                    nested.append(os.path.normpath(path))
+    return errors, files, nested
+
+
+def validate_crates(crate_dirs, workers=None):
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Crates (and the crates nested in them, level by level) are indexed in parallel
+        pending = [os.path.normpath(d) for d in crate_dirs]
+        file_checks = []
+        while pending:
+            next_level = []
+            for crate_dir, (crate_errors, files, nested) in zip(pending, executor.map(index_crate, pending)):
+                errors += crate_errors
+                file_checks += [executor.submit(check_file, crate_dir, entity) for entity in files]
+                next_level += nested
+                print(f"Indexed {crate_dir}: {len(files)} data files, {len(nested)} nested crates")
+            pending = next_level
+        for future in file_checks:
+            errors += future.result()
+    return errors
+
+
+def report(errors):
     if errors:
         print("❌ Metadata validation failed.")
         for error in errors:
             print(f"- {error}")
         sys.exit(1)
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the repository metadata, or with --crates the generated RO-Crates.")
+    parser.add_argument("--crates", nargs="*", metavar="CRATE_DIR",
+                        help=f"Check references, data entities and nested crates (default: {' '.join(GENERATED_CRATES)})")
+    parser.add_argument("--workers", type=int, help="Worker threads for --crates")
+    args = parser.parse_args()
+
+    if args.crates is not None:
+        crate_dirs = args.crates or GENERATED_CRATES
+        report(validate_crates(crate_dirs, args.workers))
+        print(f"✅ Crate validation passed ({', '.join(crate_dirs)}).")
+        return
+
+    errors = []
+
+    for path in REQUIRED_FILES:
+        if not Path(path).exists():
+            errors.append(f"Missing required file: {path}")
+
+    report(errors)
+
     cff = load_yaml("CITATION.cff")
     codemeta = load_json("codemeta.json")
     zenodo = load_json(".zenodo.json")
@@ -143,11 +299,7 @@ def main():
     if conforms_to != "https://w3id.org/ro/crate/1.1":
         errors.append("ro-crate metadata descriptor does not conform to RO-Crate 1.1")
 
-    if errors:
-        print("❌ Metadata validation failed.")
-        for error in errors:
-            print(f"- {error}")
-        sys.exit(1)
+    report(errors)
 
     print("✅ Metadata validation passed.")
 
@@ -0,0 +1,157 @@
+# stac_catalog.py
+#
+# Local cache of the Copernicus STAC catalogue. Searches follow the STAC
+# `next` links, time windows are fetched concurrently, and every L2A item is
+# kept in a small SQLite index so later selections can be answered locally
+# with only an incremental refresh from the last synced date.
+
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+STAC_URL = "https://catalogue.dataspace.copernicus.eu/stac/collections/SENTINEL-2/items"
+CATALOG_PATH = ".cache/stac_items.sqlite"
+
+PAGE_LIMIT = 100
+WINDOW_DAYS = 7
+DEFAULT_LOOKBACK_DAYS = 90
+# Products are often published days after sensing, so refreshes re-read a short overlap
+REFRESH_OVERLAP_DAYS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    datetime TEXT NOT NULL,
+    cloud_cover REAL,
+    min_lon REAL, min_lat REAL, max_lon REAL, max_lat REAL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_datetime ON items (datetime);
+CREATE INDEX IF NOT EXISTS items_bbox ON items (min_lon, max_lon, min_lat, max_lat);
+CREATE TABLE IF NOT EXISTS sync_state (
+    bbox TEXT PRIMARY KEY,
+    synced_until TEXT NOT NULL
+);
+"""
+
+
+def open_catalog(path=CATALOG_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def format_datetime(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def item_cloud_cover(item):
+    properties = item.get("properties", {})
+    for key in ("eo:cloud_cover", "cloudCover"):
+        if properties.get(key) is not None:
+            return float(properties[key])
+    return None
+
+
+def is_l2a(item):
+    return "L2A" in item.get("id", "")
+
+
+# Follow the STAC `next` links of one search until the result set is exhausted
+def fetch_pages(session, url, params):
+    while url:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        page = response.json()
+        yield page.get("features", [])
+        next_link = next((link for link in page.get("links", []) if link.get("rel") == "next"), None)
+        # The next link already carries the query string
+        url, params = (next_link["href"], None) if next_link else (None, None)
+
+
+def search_window(session, bbox, start, end, limit=PAGE_LIMIT):
+    # bbox and datetime are filtered server-side; this endpoint has no product
+    # type or cloud cover parameters, so L2A is filtered as pages arrive.
+    params = {
+        "bbox": bbox,
+        "datetime": f"{format_datetime(start)}/{format_datetime(end)}",
+        "limit": limit,
+    }
+    items = []
+    for features in fetch_pages(session, STAC_URL, params):
+        items.extend(item for item in features if is_l2a(item))
+    return items
+
+
+def time_windows(start, end, window_days=WINDOW_DAYS):
+    windows = []
+    while start < end:
+        window_end = min(start + timedelta(days=window_days), end)
+        windows.append((start, window_end))
+        start = window_end
+    return windows
+
+
+def store_items(conn, items):
+    rows = []
+    for item in items:
+        bounds = item.get("bbox") or [None] * 4
+        rows.append((
+            item["id"],
+            item.get("properties", {}).get("datetime", ""),
+            item_cloud_cover(item),
+            *bounds[:4],
+            json.dumps(item),
+        ))
+    conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+# Fetch everything published for `bbox` since the last sync (or the lookback period)
+def refresh_catalog(conn, bbox, session=None, end=None, lookback_days=DEFAULT_LOOKBACK_DAYS, workers=4):
+    session = session or requests.Session()
+    end = end or datetime.now(timezone.utc)
+    row = conn.execute("SELECT synced_until FROM sync_state WHERE bbox = ?", (bbox,)).fetchone()
+    if row:
+        synced_until = datetime.fromisoformat(row[0].replace("Z", "+00:00"))
+        start = synced_until - timedelta(days=REFRESH_OVERLAP_DAYS)
+    else:
+        start = end - timedelta(days=lookback_days)
+
+    windows = time_windows(start, end)
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(search_window, session, bbox, s, e) for s, e in windows]
+        for future in as_completed(futures):
+            items = future.result()
+            store_items(conn, items)
+            fetched += len(items)
+
+    conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (bbox, format_datetime(end)))
+    conn.commit()
+    print(f"Refreshed STAC catalogue: {fetched} L2A items across {len(windows)} windows since {format_datetime(start)}")
+    return fetched
+
+
+def query_items(conn, bbox, start=None, end=None, max_cloud_cover=None, limit=None):
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    sql = "SELECT item FROM items WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?"
+    args = [min_lon, max_lon, min_lat, max_lat]
+    if start is not None:
+        sql += " AND datetime >= ?"
+        args.append(format_datetime(start))
+    if end is not None:
+        sql += " AND datetime <= ?"
+        args.append(format_datetime(end))
+    if max_cloud_cover is not None:
+        sql += " AND cloud_cover <= ?"
+        args.append(max_cloud_cover)
+    sql += " ORDER BY datetime DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(limit)
+    return [json.loads(row[0]) for row in conn.execute(sql, args)]
@@ -1,24 +1,57 @@
 import requests
+import hashlib
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from zenodo_token import token
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-ZENODO_API_BASE = "https://zenodo.org/api"
+# Override to point the uploader at a local mock server
+ZENODO_API_BASE = os.environ.get("ZENODO_API_BASE", "https://zenodo.org/api")
 CONCEPT_RECORD_ID = 15644629  # The concept record that groups all versions
 
+TIF_NAME = "GNDVI_10m_example.tif"
+# Uploaded alongside the TIFF when present
+EXTRA_ARTIFACTS = ["workflow_preview.png", "provenance_output.crate.zip"]
+# Differ on every run (timestamps, run ids), so they never decide whether a new version is needed
+VOLATILE_ARTIFACTS = ["provenance_output.crate.zip"]
+UPLOAD_WORKERS = 4
+UPLOAD_RETRIES = 5
+BACKOFF_SECONDS = 2
+CHUNK_SIZE = 1024 * 1024
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+
+
+def get_session():
+    # Pooled connections shared by every API call and upload thread
+    global _session
+    if _session is None:
+        # Imported here so the constants above can be used without a token
+        from zenodo_token import token
+        _session = requests.Session()
+        _session.params = {"access_token": token}
+        # Automatic retries only for requests without a streamed body
+        retry = Retry(total=UPLOAD_RETRIES, backoff_factor=BACKOFF_SECONDS,
+                      status_forcelist=sorted(RETRY_STATUS), allowed_methods=["GET", "DELETE"])
+        adapter = HTTPAdapter(pool_connections=UPLOAD_WORKERS, pool_maxsize=UPLOAD_WORKERS, max_retries=retry)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
 def list_depositions():
     url = f"{ZENODO_API_BASE}/deposit/depositions"
-    params = {"access_token": token}
-    response = requests.get(url, params=params)
+    response = get_session().get(url)
     response.raise_for_status()
     print(response.json())
     return response.json()
 
 def create_new_version():
     url = f"{ZENODO_API_BASE}/deposit/depositions/{CONCEPT_RECORD_ID}/actions/newversion"
-    params = {"access_token": token}
-    response = requests.post(url, params=params)
+    response = get_session().post(url)
     if response.status_code == 404:
         print(f"❌ Concept record ID {CONCEPT_RECORD_ID} not found. It may not exist or you may not have access.")
         return None
@@ -30,12 +63,10 @@ def create_new_version():
     new_deposition_id = int(new_draft_url.split("/")[-1])
     return new_deposition_id
 
-def get_incremented_version(deposition_id):
-    
+def get_latest_record(deposition_id):
     # Retrieve the concept record for the deposition
     deposition_url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}"
-    params = {"access_token": token}
-    response = requests.get(deposition_url, params=params)
+    response = get_session().get(deposition_url)
     response.raise_for_status()
     conceptrecid = response.json().get("conceptrecid")
 
@@ -45,14 +76,16 @@ def get_incremented_version(deposition_id):
         "q": f"conceptrecid:{conceptrecid}",
         "sort": "mostrecent",
         "size": 1,
-        "access_token": token
     }
-    records_response = requests.get(url, params=query_params)
+    records_response = get_session().get(url, params=query_params)
     records_response.raise_for_status()
     hits = records_response.json().get("hits", {}).get("hits", [])
-    if hits:
-        metadata = hits[0].get("metadata", {})
-        current_version = metadata.get("version", "1.0.0")
+    return hits[0] if hits else None
+
+def get_incremented_version(deposition_id):
+    latest = get_latest_record(deposition_id)
+    if latest:
+        current_version = latest.get("metadata", {}).get("version", "1.0.0")
     else:
         current_version = "1.0.0"
 
@@ -67,7 +100,6 @@ def get_incremented_version(deposition_id):
 
 def update_metadata(deposition_id):
     url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}"
-    params = {"access_token": token}
     headers = {"Content-Type": "application/json"}
     metadata = {
         "metadata": {
@@ -96,64 +128,135 @@ def update_metadata(deposition_id):
             "language": "eng"
         }
     }
-    response = requests.put(url, params=params, data=json.dumps(metadata), headers=headers)
+    response = get_session().put(url, data=json.dumps(metadata), headers=headers)
     response.raise_for_status()
     return response.json()
 
-def upload_file_to_deposition(deposition_id, file_path):
-    url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}/files"
-    params = {"access_token": token}
-    # Check for and delete existing file with the same name
-    files_url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}/files"
-    list_response = requests.get(files_url, params=params)
-    list_response.raise_for_status()
-    for existing_file in list_response.json():
-        if existing_file["filename"] == os.path.basename(file_path):
-            file_id = existing_file["id"]
-            delete_url = f"{files_url}/{file_id}"
-            del_response = requests.delete(delete_url, params=params)
-            del_response.raise_for_status()
-            print(f"Deleted existing file with same name: {existing_file['filename']}")
-    with open(file_path, "rb") as fp:
-        files = {"file": (os.path.basename(file_path), fp)}
-        response = requests.post(url, params=params, files=files)
-    if response.status_code == 400:
-        print("❌ Bad request (400) when uploading file. Response content:")
-        print(response.text)
-        response.raise_for_status()
-    elif response.status_code != 201:
-        print("❌ Failed to upload file. Response:")
-        print(response.status_code, response.text)
-        response.raise_for_status()
-    return response.json()
+class HashingReader:
+    # File wrapper that MD5s the bytes as requests streams them
+    def __init__(self, fp, size):
+        self.fp = fp
+        self.size = size
+        self.md5 = hashlib.md5()
+
+    def __len__(self):
+        return self.size
+
+    def read(self, n=-1):
+        chunk = self.fp.read(CHUNK_SIZE if n is None or n < 0 else n)
+        self.md5.update(chunk)
+        return chunk
+
+
+def get_bucket_url(deposition_id):
+    url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}"
+    response = get_session().get(url)
+    response.raise_for_status()
+    return response.json()["links"]["bucket"]
+
+
+def upload_file_to_bucket(bucket_url, file_path, filename=None):
+    # Streamed PUT into the deposition bucket; a PUT to an existing key replaces it
+    filename = filename or os.path.basename(file_path)
+    url = f"{bucket_url}/{filename}"
+    size = os.path.getsize(file_path)
+
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            with open(file_path, "rb") as fp:
+                reader = HashingReader(fp, size)
+                response = get_session().put(url, data=reader, headers={"Content-Type": "application/octet-stream"})
+            if response.status_code in RETRY_STATUS:
+                raise requests.HTTPError(f"{response.status_code} {response.text}", response=response)
+            if response.status_code >= 400:
+                print(f"❌ Failed to upload {filename}. Response:")
+                print(response.status_code, response.text)
+                response.raise_for_status()
+
+            local_checksum = f"md5:{reader.md5.hexdigest()}"
+            remote_checksum = response.json().get("checksum")
+            if remote_checksum != local_checksum:
+                raise requests.HTTPError(f"Checksum mismatch for {filename}: sent {local_checksum}, stored {remote_checksum}")
+            print(f"Uploaded {filename} ({size} bytes, {local_checksum})")
+            return response.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code not in RETRY_STATUS:
+                raise
+            if attempt == UPLOAD_RETRIES:
+                raise
+            delay = BACKOFF_SECONDS * 2 ** attempt
+            print(f"⚠️ Upload of {filename} failed ({e}); retrying in {delay}s")
+            time.sleep(delay)
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def record_checksums(record):
+    # filename -> md5 hex for the files of a published record (new and legacy record layouts)
+    checksums = {}
+    for entry in (record or {}).get("files", []):
+        name = entry.get("key") or entry.get("filename")
+        checksum = entry.get("checksum", "")
+        checksums[name] = checksum.split(":", 1)[-1]
+    return checksums
+
+
+def changed_artifacts(artifacts, published):
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        local = dict(zip(artifacts, pool.map(file_md5, artifacts)))
+    return [path for path in artifacts if published.get(os.path.basename(path)) != local[path]]
+
+
+def upload_files_to_deposition(deposition_id, file_paths):
+    bucket_url = get_bucket_url(deposition_id)
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        futures = [pool.submit(upload_file_to_bucket, bucket_url, path) for path in file_paths]
+        return [future.result() for future in futures]
+
 
 def publish_deposition(deposition_id):
     url = f"{ZENODO_API_BASE}/deposit/depositions/{deposition_id}/actions/publish"
-    params = {"access_token": token}
-    response = requests.post(url, params=params)
+    response = get_session().post(url)
     response.raise_for_status()
     return response.json()
 
 def main():
+    # The georeferenced index raster (*.index.tif) is an intermediate, not the figure
+    tif_file = next((f for f in os.listdir(".") if f.endswith(".tif") and not f.endswith(".index.tif")), None)
+    if not tif_file:
+        print("No .tif file found in current directory.")
+        return
+
+    os.rename(tif_file, TIF_NAME)
+    artifacts = [TIF_NAME] + [f for f in EXTRA_ARTIFACTS if os.path.exists(f)]
+
+    # Compare against the latest published version before opening a draft
+    latest = get_latest_record(CONCEPT_RECORD_ID)
+    changed = changed_artifacts(artifacts, record_checksums(latest))
+    if latest and all(path in VOLATILE_ARTIFACTS for path in changed):
+        doi = latest.get("doi") or latest.get("metadata", {}).get("doi")
+        print(f"Artifacts match the latest published version ({doi}); skipping new version.")
+        return
+
     deposition_id = create_new_version()
     if not deposition_id:
         print("Exiting due to failure creating new version.")
         return
 
-    tif_file = next((f for f in os.listdir(".") if f.endswith(".tif")), None)
-    if not tif_file:
-        print("No .tif file found in current directory.")
-        return
-    
-    os.rename(tif_file, "GNDVI_10m_example.tif")
-    tif_file = "GNDVI_10m_example.tif"
-
     print(f"New draft deposition ID: {deposition_id}")
 
-    print(f"Uploading {tif_file}...")
+    # The draft starts with the previous version's files, so unchanged ones are reused as-is
+    print(f"Uploading {', '.join(changed)}...")
     try:
-        upload_response = upload_file_to_deposition(deposition_id, tif_file)
-        print(f"Uploaded file metadata: {upload_response}")
+        upload_responses = upload_files_to_deposition(deposition_id, changed)
+        print(f"Uploaded file metadata: {upload_responses}")
     except requests.HTTPError as e:
         print("Upload failed with error:")
         print(e)